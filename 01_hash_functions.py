@@ -22,6 +22,17 @@ Below the sha256 function from the sha2 family is implemented without the use
 of packages.
 """
 
+import hashlib
+import mmap
+import os
+import struct
+import time
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for the batch functions
+    np = None
+
 
 def sigma_0(x: str) -> str:
     # xor sum of right-rotates and right-shifts
@@ -189,14 +200,14 @@ def sha_256(message: str):
                 b = a % 2**32
                 a = (temp1 + temp2) % 2**32
 
-            h0 += a % 2**32
-            h1 += b % 2**32
-            h2 += c % 2**32
-            h3 += d % 2**32
-            h4 += e % 2**32
-            h5 += f % 2**32
-            h6 += g % 2**32
-            h7 += h % 2**32
+            h0 = (h0 + a) % 2**32
+            h1 = (h1 + b) % 2**32
+            h2 = (h2 + c) % 2**32
+            h3 = (h3 + d) % 2**32
+            h4 = (h4 + e) % 2**32
+            h5 = (h5 + f) % 2**32
+            h6 = (h6 + g) % 2**32
+            h7 = (h7 + h) % 2**32
 
         final_h_values = [h0, h1, h2, h3, h4, h5, h6, h7]
         h_values_mod = [h % (2 ** 32) for h in final_h_values]
@@ -210,3 +221,658 @@ def sha_256(message: str):
         return None  # Gracefully handle the error by returning None
 
 
+"""
+The string implementation above follows the specification closely, but every
+32 bit word is a string of '0' and '1' characters, so each rotation and xor
+runs character by character.
+
+Below the same algorithm keeps the state and message schedule as integers.
+Right-rotates become a pair of shifts, the results are masked back to 32 bits,
+and bytes like input is read directly in 64 byte blocks.
+"""
+
+MASK_32 = 0xFFFFFFFF
+
+# Eight initial values based of square roots of first 8 primes.
+H_values = (0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a,
+            0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19)
+
+K_table = tuple(K_values)
+
+block_words = struct.Struct('>16L')
+
+
+def sha_256_compress(state: list[int], block: bytes | memoryview,
+                     offset: int, schedule: list[int]) -> None:
+    """
+    Compress one 64 byte block, starting at offset, into the state in place.
+
+    The schedule is a preallocated list of 64 words reused between blocks.
+    Rotations are written inline, a rotate right by n of a 32 bit word x
+    is (x >> n | x << (32 - n)), masked back to 32 bits.
+    """
+    w = schedule
+    w[0:16] = block_words.unpack_from(block, offset)
+
+    for i in range(16, 64):
+        x = w[i - 15]
+        y = w[i - 2]
+        s0 = (x >> 7 | x << 25) ^ (x >> 18 | x << 14) ^ (x >> 3)
+        s1 = (y >> 17 | y << 15) ^ (y >> 19 | y << 13) ^ (y >> 10)
+        w[i] = (w[i - 16] + s0 + w[i - 7] + s1) & MASK_32
+
+    a, b, c, d, e, f, g, h = state
+    k = K_table
+
+    for i in range(64):
+        s1 = (e >> 6 | e << 26) ^ (e >> 11 | e << 21) ^ (e >> 25 | e << 7)
+        choice = (e & f) ^ (~e & g)
+        temp1 = (h + (s1 & MASK_32) + choice + k[i] + w[i]) & MASK_32
+
+        s0 = (a >> 2 | a << 30) ^ (a >> 13 | a << 19) ^ (a >> 22 | a << 10)
+        majority = (a & b) ^ (a & c) ^ (b & c)
+        temp2 = (s0 & MASK_32) + majority
+
+        h = g
+        g = f
+        f = e
+        e = (d + temp1) & MASK_32
+        d = c
+        c = b
+        b = a
+        a = (temp1 + temp2) & MASK_32
+
+    state[0] = (state[0] + a) & MASK_32
+    state[1] = (state[1] + b) & MASK_32
+    state[2] = (state[2] + c) & MASK_32
+    state[3] = (state[3] + d) & MASK_32
+    state[4] = (state[4] + e) & MASK_32
+    state[5] = (state[5] + f) & MASK_32
+    state[6] = (state[6] + g) & MASK_32
+    state[7] = (state[7] + h) & MASK_32
+
+
+def sha_256_padding(length: int) -> bytes:
+    # A 1 bit, zeros up to 56 mod 64 bytes, then the bit length in 64 bits.
+    zeros = (55 - length) % 64
+    return b'\x80' + b'\x00' * zeros + (8 * length).to_bytes(8, 'big')
+
+
+def sha_256_fast(message: str | bytes | bytearray | memoryview):
+    """
+    Integer word sha256, identical in output to hashlib.sha256. Strings are
+    encoded as utf-8, so they match sha_256 only for ASCII text, as sha_256
+    hashes one byte per character. Bytes like input is hashed in place
+    without copying the full blocks.
+    """
+    try:
+        if isinstance(message, str):
+            message = message.encode()
+        if not isinstance(message, (bytes, bytearray, memoryview)):
+            raise TypeError("Input must be a string or bytes like object.")
+
+        data = memoryview(message).cast('B')
+        length = len(data)
+        full_length = length - length % 64
+
+        state = list(H_values)
+        schedule = [0] * 64
+
+        for offset in range(0, full_length, 64):
+            sha_256_compress(state, data, offset, schedule)
+
+        tail = bytes(data[full_length:]) + sha_256_padding(length)
+        for offset in range(0, len(tail), 64):
+            sha_256_compress(state, tail, offset, schedule)
+
+        return ''.join(f'{h:08x}' for h in state)
+
+    except TypeError as e:
+        print(f"Error: {e}")
+        return None  # Gracefully handle the error by returning None
+
+
+class SHA256:
+    """
+    Streaming sha256 with the hashlib interface, update(), digest(),
+    hexdigest() and copy(), built on the integer compression function.
+
+    Input is compressed as soon as a full 64 byte block is available, only
+    an incomplete block is kept in a fixed size buffer, so memory use does
+    not grow with the length of the message.
+    """
+    name = 'sha256'
+    digest_size = 32
+    block_size = 64
+
+    def __init__(self, data: bytes | bytearray | memoryview = b'') -> None:
+        self._state = list(H_values)
+        self._buffer = bytearray(64)
+        self._buffered = 0
+        self._length = 0
+        self._schedule = [0] * 64
+        if data:
+            self.update(data)
+
+    def update(self, data: bytes | bytearray | memoryview) -> None:
+        if isinstance(data, str):
+            raise TypeError("Strings must be encoded before hashing.")
+
+        view = memoryview(data).cast('B')
+        size = len(view)
+        self._length += size
+        position = 0
+
+        # Top up a partially filled buffer first.
+        if self._buffered:
+            position = min(64 - self._buffered, size)
+            self._buffer[self._buffered:self._buffered + position] = \
+                view[:position]
+            self._buffered += position
+            if self._buffered < 64:
+                return
+            sha_256_compress(self._state, self._buffer, 0, self._schedule)
+            self._buffered = 0
+
+        # Whole blocks are compressed straight from the input.
+        full = position + (size - position) // 64 * 64
+        for offset in range(position, full, 64):
+            sha_256_compress(self._state, view, offset, self._schedule)
+
+        remainder = size - full
+        self._buffer[:remainder] = view[full:]
+        self._buffered = remainder
+
+    def digest(self) -> bytes:
+        # Pad a copy of the state, so that the hash may still be updated.
+        state = self._state.copy()
+        tail = (bytes(self._buffer[:self._buffered])
+                + sha_256_padding(self._length))
+        for offset in range(0, len(tail), 64):
+            sha_256_compress(state, tail, offset, self._schedule)
+        return struct.pack('>8L', *state)
+
+    def hexdigest(self) -> str:
+        return self.digest().hex()
+
+    def copy(self) -> 'SHA256':
+        """
+        Snapshot the midstate, eight words, the buffered bytes and the length.
+        A shared prefix can be hashed once and then branched from.
+        """
+        other = SHA256.__new__(SHA256)
+        other._state = self._state.copy()
+        other._buffer = self._buffer.copy()
+        other._buffered = self._buffered
+        other._length = self._length
+        other._schedule = [0] * 64
+        return other
+
+
+def sha_256_file(path: str, chunk_size: int = 1 << 20,
+                 use_mmap: bool = False) -> str:
+    """
+    Hash a file in constant memory. Chunks are read with readinto into a
+    single reused buffer, or the file is memory mapped and hashed in place.
+    """
+    hasher = SHA256()
+    with open(path, 'rb') as file:
+        if use_mmap:
+            # Empty files cannot be memory mapped.
+            if file.seek(0, 2) == 0:
+                return hasher.hexdigest()
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                hasher.update(mapped)
+            return hasher.hexdigest()
+
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        while True:
+            size = file.readinto(buffer)
+            if not size:
+                break
+            hasher.update(view[:size])
+    return hasher.hexdigest()
+
+
+"""
+Many short messages may be hashed together. Messages with the same number of
+blocks are stacked so that each 32 bit word of the state is a numpy array with
+one lane per message, and every step of the 64 rounds runs across all lanes.
+"""
+
+
+def rotr_lanes(x, n: int):
+    # Right-rotate every uint32 lane, numpy wraps the left shift to 32 bits.
+    return (x >> n) | (x << (32 - n))
+
+
+def sha_256_lanes(words) -> 'np.ndarray':
+    """
+    Hash a (messages, blocks * 16) uint32 array of padded message words,
+    returning a (messages, 8) array of the final hash values.
+    """
+    count, total_words = words.shape
+    k = np.array(K_values, dtype=np.uint32)
+    state = [np.full(count, h, dtype=np.uint32) for h in H_values]
+    schedule = np.empty((64, count), dtype=np.uint32)
+
+    for start in range(0, total_words, 16):
+        w = schedule
+        w[:16] = words[:, start:start + 16].T
+
+        for i in range(16, 64):
+            x = w[i - 15]
+            y = w[i - 2]
+            s0 = rotr_lanes(x, 7) ^ rotr_lanes(x, 18) ^ (x >> 3)
+            s1 = rotr_lanes(y, 17) ^ rotr_lanes(y, 19) ^ (y >> 10)
+            w[i] = w[i - 16] + s0 + w[i - 7] + s1
+
+        a, b, c, d, e, f, g, h = state
+
+        for i in range(64):
+            s1 = rotr_lanes(e, 6) ^ rotr_lanes(e, 11) ^ rotr_lanes(e, 25)
+            choice = (e & f) ^ (~e & g)
+            temp1 = h + s1 + choice + k[i] + w[i]
+            s0 = rotr_lanes(a, 2) ^ rotr_lanes(a, 13) ^ rotr_lanes(a, 22)
+            majority = (a & b) ^ (a & c) ^ (b & c)
+            temp2 = s0 + majority
+
+            h, g, f, e = g, f, e, d + temp1
+            d, c, b, a = c, b, a, temp1 + temp2
+
+        state = [s + v for s, v in zip(state, (a, b, c, d, e, f, g, h))]
+
+    return np.stack(state, axis=1)
+
+
+def sha_256_batch(messages: list[str | bytes], hex_output: bool = True):
+    """
+    Hash a list of messages at once. Messages are grouped by block count,
+    padded and packed into uint32 arrays, and each group is hashed lane
+    parallel. Returns a list of hex strings, or a (messages, 32) uint8
+    array of digests when hex_output is False.
+    """
+    if np is None:
+        raise ImportError("sha_256_batch requires numpy.")
+
+    encoded = [m.encode() if isinstance(m, str) else bytes(m)
+               for m in messages]
+
+    groups: dict[int, list[int]] = {}
+    for index, message in enumerate(encoded):
+        # Padding adds at least 9 bytes, a 0x80 byte and the 8 byte length.
+        blocks = (len(message) + 9 + 63) // 64
+        groups.setdefault(blocks, []).append(index)
+
+    digests = np.empty((len(encoded), 8), dtype=np.uint32)
+    for blocks, indices in groups.items():
+        padded = b''.join(encoded[i] + sha_256_padding(len(encoded[i]))
+                          for i in indices)
+        words = np.frombuffer(padded, dtype='>u4').astype(np.uint32)
+        digests[indices] = sha_256_lanes(words.reshape(len(indices),
+                                                       blocks * 16))
+
+    raw = digests.astype('>u4').view(np.uint8).reshape(len(encoded), 32)
+    if not hex_output:
+        return raw
+    hex_string = raw.tobytes().hex()
+    return [hex_string[i:i + 64] for i in range(0, len(hex_string), 64)]
+
+
+"""
+SHA-3 is not built from compression rounds like sha256, but from a sponge.
+A 1600 bit state, 25 lanes of 64 bits in a 5x5 grid, absorbs the message
+136 bytes at a time by XOR into its first 17 lanes, each block followed by
+the Keccak-f[1600] permutation. The digest is squeezed from the first lanes.
+
+Each of the 24 rounds of the permutation has five steps:
+
+1. Theta: each lane is XORed with the parity of the two adjacent columns.
+
+2. Rho: each lane is rotated by a fixed, triangular number offset.
+
+3. Pi: the lanes are moved around the grid, (x, y) to (y, 2x + 3y).
+
+4. Chi: each lane is XORed with the NOT of the next lane in its row, ANDed
+   with the one after it, the only non linear step.
+
+5. Iota: a round constant is XORed into the first lane.
+
+Lanes are held as 25 Python integers, lane x + 5y for column x of row y,
+masked back to 64 bits after every rotation.
+"""
+
+MASK_64 = 0xFFFFFFFFFFFFFFFF
+SHA_3_256_RATE = 136
+
+sha_3_block_lanes = struct.Struct('<17Q')
+
+
+def keccak_round_constants() -> tuple[int, ...]:
+    """
+    Round constants from the LFSR x^8 + x^6 + x^5 + x^4 + 1, each output
+    bit j of a round setting bit 2^j - 1 of its constant.
+    """
+    register = 1
+    constants = []
+    for _ in range(24):
+        constant = 0
+        for j in range(7):
+            if register & 1:
+                constant |= 1 << (1 << j) - 1
+            register <<= 1
+            if register & 0x100:
+                register ^= 0x171
+        constants.append(constant)
+    return tuple(constants)
+
+
+def keccak_rho_pi() -> tuple[tuple[int, int, int], ...]:
+    # (source lane, target lane, rotation) for the rho and pi steps.
+    offsets = {(0, 0): 0}
+    x, y = 1, 0
+    for t in range(24):
+        offsets[x, y] = (t + 1) * (t + 2) // 2 % 64
+        x, y = y, (2 * x + 3 * y) % 5
+    return tuple((x + 5 * y, y + 5 * ((2 * x + 3 * y) % 5), offsets[x, y])
+                 for y in range(5) for x in range(5))
+
+
+KECCAK_ROUND_CONSTANTS = keccak_round_constants()
+KECCAK_RHO_PI = keccak_rho_pi()
+
+
+def keccak_f(a: list[int]) -> None:
+    # Permute the 25 lanes in place, over the 24 rounds of Keccak-f[1600].
+    b = [0] * 25
+    for constant in KECCAK_ROUND_CONSTANTS:
+        c = [a[x] ^ a[x + 5] ^ a[x + 10] ^ a[x + 15] ^ a[x + 20]
+             for x in range(5)]
+        for x in range(5):
+            right = c[(x + 1) % 5]
+            d = c[(x - 1) % 5] ^ ((right << 1 | right >> 63) & MASK_64)
+            a[x] ^= d
+            a[x + 5] ^= d
+            a[x + 10] ^= d
+            a[x + 15] ^= d
+            a[x + 20] ^= d
+
+        for source, target, rotation in KECCAK_RHO_PI:
+            lane = a[source]
+            b[target] = (lane << rotation | lane >> (64 - rotation)) & MASK_64
+
+        for y in range(0, 25, 5):
+            b0, b1, b2, b3, b4 = b[y:y + 5]
+            a[y] = b0 ^ (~b1 & b2)
+            a[y + 1] = b1 ^ (~b2 & b3)
+            a[y + 2] = b2 ^ (~b3 & b4)
+            a[y + 3] = b3 ^ (~b4 & b0)
+            a[y + 4] = b4 ^ (~b0 & b1)
+
+        a[0] ^= constant
+
+
+def sha_3_padding(length: int, rate: int = SHA_3_256_RATE) -> bytes:
+    # The SHA-3 domain bits 01 and a 1 bit, zeros, then a final 1 bit.
+    padding = bytearray(rate - length % rate)
+    padding[0] ^= 0x06
+    padding[-1] ^= 0x80
+    return bytes(padding)
+
+
+def sha_3_absorb(lanes: list[int], block: bytes | memoryview,
+                 offset: int) -> None:
+    for i, word in enumerate(sha_3_block_lanes.unpack_from(block, offset)):
+        lanes[i] ^= word
+    keccak_f(lanes)
+
+
+class SHA3_256:
+    """
+    Streaming sha3_256 with the hashlib interface, update(), digest(),
+    hexdigest() and copy(). Full 136 byte blocks are absorbed as they
+    arrive, only an incomplete block is buffered.
+    """
+    name = 'sha3_256'
+    digest_size = 32
+    block_size = SHA_3_256_RATE
+
+    def __init__(self, data: bytes | bytearray | memoryview = b'') -> None:
+        self._lanes = [0] * 25
+        self._buffer = bytearray(SHA_3_256_RATE)
+        self._buffered = 0
+        if data:
+            self.update(data)
+
+    def update(self, data: bytes | bytearray | memoryview) -> None:
+        if isinstance(data, str):
+            raise TypeError("Strings must be encoded before hashing.")
+
+        view = memoryview(data).cast('B')
+        size = len(view)
+        rate = SHA_3_256_RATE
+        position = 0
+
+        if self._buffered:
+            position = min(rate - self._buffered, size)
+            self._buffer[self._buffered:self._buffered + position] = \
+                view[:position]
+            self._buffered += position
+            if self._buffered < rate:
+                return
+            sha_3_absorb(self._lanes, self._buffer, 0)
+            self._buffered = 0
+
+        full = position + (size - position) // rate * rate
+        for offset in range(position, full, rate):
+            sha_3_absorb(self._lanes, view, offset)
+
+        remainder = size - full
+        self._buffer[:remainder] = view[full:]
+        self._buffered = remainder
+
+    def digest(self) -> bytes:
+        # Pad a copy of the lanes, so that the hash may still be updated.
+        lanes = self._lanes.copy()
+        tail = bytes(self._buffer[:self._buffered])
+        sha_3_absorb(lanes, tail + sha_3_padding(len(tail)), 0)
+        return struct.pack('<4Q', *lanes[:4])
+
+    def hexdigest(self) -> str:
+        return self.digest().hex()
+
+    def copy(self) -> 'SHA3_256':
+        other = SHA3_256.__new__(SHA3_256)
+        other._lanes = self._lanes.copy()
+        other._buffer = self._buffer.copy()
+        other._buffered = self._buffered
+        return other
+
+
+def sha_3_256(message: str | bytes | bytearray | memoryview):
+    """
+    Manual sha3_256, identical in output to hashlib.sha3_256. Strings are
+    encoded as utf-8.
+    """
+    try:
+        if isinstance(message, str):
+            message = message.encode()
+        if not isinstance(message, (bytes, bytearray, memoryview)):
+            raise TypeError("Input must be a string or bytes like object.")
+        return SHA3_256(message).hexdigest()
+
+    except TypeError as e:
+        print(f"Error: {e}")
+        return None  # Gracefully handle the error by returning None
+
+
+"""
+As for sha256, many messages may be hashed at once. A (25, messages) uint64
+array holds one column of lanes per message, and every step of the
+permutation runs across all messages, numpy wraps the shifts to 64 bits.
+"""
+
+
+def rotl_lanes_64(x, n: int):
+    # Left-rotate every uint64 lane, a rotation by 0 leaves it unchanged.
+    if n == 0:
+        return x
+    return (x << np.uint64(n)) | (x >> np.uint64(64 - n))
+
+
+def keccak_f_lanes(state) -> None:
+    # Permute a (25, messages) uint64 state in place, all columns at once.
+    count = state.shape[1]
+    grid = state.reshape(5, 5, count)
+    b = np.empty_like(state)
+    b_grid = b.reshape(5, 5, count)
+    for constant in KECCAK_ROUND_CONSTANTS:
+        c = np.bitwise_xor.reduce(grid, axis=0)
+        d = np.roll(c, 1, axis=0) ^ rotl_lanes_64(np.roll(c, -1, axis=0), 1)
+        grid ^= d
+
+        for source, target, rotation in KECCAK_RHO_PI:
+            b[target] = rotl_lanes_64(state[source], rotation)
+
+        grid[:] = b_grid ^ (~np.roll(b_grid, -1, axis=1)
+                            & np.roll(b_grid, -2, axis=1))
+        state[0] ^= np.uint64(constant)
+
+
+def sha_3_256_batch(messages: list[str | bytes], hex_output: bool = True):
+    """
+    Hash a list of messages at once with sha3_256. Messages are grouped by
+    block count, padded and packed into uint64 arrays, and each group is
+    absorbed lane parallel. Returns a list of hex strings, or a (messages,
+    32) uint8 array of digests when hex_output is False.
+    """
+    if np is None:
+        raise ImportError("sha_3_256_batch requires numpy.")
+
+    encoded = [m.encode() if isinstance(m, str) else bytes(m)
+               for m in messages]
+    rate = SHA_3_256_RATE
+
+    groups: dict[int, list[int]] = {}
+    for index, message in enumerate(encoded):
+        # Padding adds between 1 and 136 bytes.
+        groups.setdefault(len(message) // rate + 1, []).append(index)
+
+    digests = np.empty((len(encoded), 4), dtype=np.uint64)
+    for blocks, indices in groups.items():
+        padded = b''.join(encoded[i] + sha_3_padding(len(encoded[i]))
+                          for i in indices)
+        words = np.frombuffer(padded, dtype='<u8').astype(np.uint64)
+        words = words.reshape(len(indices), blocks * 17)
+        state = np.zeros((25, len(indices)), dtype=np.uint64)
+        for block in range(blocks):
+            state[:17] ^= words[:, block * 17:(block + 1) * 17].T
+            keccak_f_lanes(state)
+        digests[indices] = state[:4].T
+
+    raw = digests.astype('<u8').view(np.uint8).reshape(len(encoded), 32)
+    if not hex_output:
+        return raw
+    hex_string = raw.tobytes().hex()
+    return [hex_string[i:i + 64] for i in range(0, len(hex_string), 64)]
+
+
+def benchmark_sha_256(size: int = 4096, repeats: int = 3) -> dict[str, float]:
+    """
+    Time the string implementation, the integer implementation and hashlib
+    on a message of the given size, returning the best time of each in seconds.
+    """
+    message = 'a' * size
+    message_bytes = message.encode()
+    candidates = {
+        'sha_256 (strings)': lambda: sha_256(message),
+        'sha_256_fast (integers)': lambda: sha_256_fast(message_bytes),
+        'hashlib.sha256': lambda: hashlib.sha256(message_bytes).hexdigest(),
+    }
+
+    results = {}
+    for name, function in candidates.items():
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            function()
+            best = min(best, time.perf_counter() - start)
+        results[name] = best
+
+    base = results['sha_256 (strings)']
+    for name, seconds in results.items():
+        print(f'{name:<26} {seconds * 1000:10.3f} ms   '
+              f'{base / seconds:10.1f}x')
+    return results
+
+
+def benchmark_sha_256_batch(records: int = 100_000) -> dict[str, float]:
+    """
+    Hash a batch of short records, as one call of sha_256_batch and as a loop
+    over sha_256_fast and hashlib, returning records per second for each.
+    """
+    messages = [f'record-{i:012d}'.encode() for i in range(records)]
+    assert sha_256_batch(messages[:1000]) == [
+        hashlib.sha256(m).hexdigest() for m in messages[:1000]]
+
+    candidates = {
+        'sha_256_batch (numpy)': lambda: sha_256_batch(messages),
+        'sha_256_fast (loop)': lambda: [sha_256_fast(m) for m in messages],
+        'hashlib.sha256 (loop)':
+            lambda: [hashlib.sha256(m).hexdigest() for m in messages],
+    }
+
+    results = {}
+    for name, function in candidates.items():
+        start = time.perf_counter()
+        function()
+        results[name] = records / (time.perf_counter() - start)
+        print(f'{name:<26} {results[name]:14,.0f} records/s')
+    return results
+
+
+def benchmark_sha_3_256(size: int = 1 << 16,
+                        records: int = 20_000) -> dict[str, float]:
+    """
+    MB/s of sha_3_256 and hashlib.sha3_256 on one message of the given size,
+    then records per second for a batch of short records, with one call of
+    sha_3_256_batch and as a loop over sha_3_256 and hashlib.
+    """
+    message = os.urandom(size)
+    assert sha_3_256(message) == hashlib.sha3_256(message).hexdigest()
+    results = {}
+    for name, function in {
+        'sha_3_256': lambda: sha_3_256(message),
+        'hashlib.sha3_256': lambda: hashlib.sha3_256(message).hexdigest(),
+    }.items():
+        start = time.perf_counter()
+        function()
+        results[name] = size / (time.perf_counter() - start) / 1e6
+        print(f'{name:<26} {results[name]:14.2f} MB/s')
+
+    messages = [f'record-{i:012d}'.encode() for i in range(records)]
+    candidates = {
+        'sha_3_256 (loop)': lambda: [sha_3_256(m) for m in messages],
+        'hashlib.sha3_256 (loop)':
+            lambda: [hashlib.sha3_256(m).hexdigest() for m in messages],
+    }
+    if np is not None:
+        assert sha_3_256_batch(messages[:1000]) == [
+            hashlib.sha3_256(m).hexdigest() for m in messages[:1000]]
+        candidates['sha_3_256_batch (numpy)'] = \
+            lambda: sha_3_256_batch(messages)
+
+    for name, function in candidates.items():
+        start = time.perf_counter()
+        function()
+        results[name] = records / (time.perf_counter() - start)
+        print(f'{name:<26} {results[name]:14,.0f} records/s')
+    return results
+
+
+if __name__ == '__main__':
+    benchmark_sha_256()
+    if np is not None:
+        benchmark_sha_256_batch()
+    benchmark_sha_3_256()
@@ -1,7 +1,19 @@
 import hashlib
+import functools
+import itertools
+import os
+import time
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from cryptography.hazmat.primitives.asymmetric import rsa
 
+from modern_cryptography import process_worker
+from modern_cryptography.example_keys import (benchmark_import_time,
+                                              load_or_generate_key,
+                                              make_key_getattr)
+
 
 def sha_3_256(string: str) -> str:
     sha3_256_hash = hashlib.sha3_256(string.encode()).hexdigest()
@@ -40,14 +52,23 @@ original hash and compare it to a hash of the message.
 Demonstrating that the sender must know the private key.
 """
 
-# Generate a private and public key.
-private_key_example = rsa.generate_private_key(public_exponent=65537,
-                                               key_size=2048)
-public_key_example = private_key_example.public_key()
+"""
+The example key is only generated the first time private_key_example,
+public_key_example, e, n or d is used, not at import, by load_or_generate_key
+of modern_cryptography.example_keys.
+"""
+
 
-e = public_key_example.public_numbers().e
-n = public_key_example.public_numbers().n
-d = private_key_example.private_numbers().d
+@functools.cache
+def example_private_key() -> rsa.RSAPrivateKey:
+    return load_or_generate_key('digital_signatures')
+
+
+__getattr__ = make_key_getattr(globals(), example_private_key, {
+    'private_key_example': 'private_key',
+    'public_key_example': 'public_key',
+    'e': 'e', 'n': 'n', 'd': 'd',
+})
 
 
 def digital_signature(message: str, private_key: int, mod: int) -> int:
@@ -74,3 +95,222 @@ def verify(message: str, signature: int, public_key: int, mod: int) -> str:
         return 'Message signature verified.'
     else:
         return 'Message signature not valid.'
+
+
+"""
+Signing with the full private exponent d mod n is the slow step. Knowing the
+primes p and q, the Chinese remainder theorem splits it into two half size
+exponentiations, hash^dp mod p and hash^dq mod q, with dp = d mod (p - 1) and
+dq = d mod (q - 1), recombined with qinv, the inverse of q mod p.
+
+Each half uses sliding windows. The exponent is read from the top bit in
+windows of up to w bits that start and end with a 1, so one multiplication
+by an odd power of the base covers up to w bits, instead of one per set bit.
+"""
+
+
+def sliding_window_schedule(t: int, window: int = 5) -> list[tuple[int, int]]:
+    """
+    Split an exponent into (squarings, odd value) steps, read from the most
+    significant bit. A value of 0 marks a run of trailing squarings.
+    """
+    if t == 0:
+        return []
+
+    bits = bin(t)[2:]
+    steps = []
+    zeros = 0
+    i = 0
+    while i < len(bits):
+        if bits[i] == '0':
+            zeros += 1
+            i += 1
+            continue
+        # The window ends at the last 1 within reach.
+        j = min(i + window, len(bits))
+        while bits[j - 1] == '0':
+            j -= 1
+        steps.append((zeros + j - i, int(bits[i:j], 2)))
+        zeros = 0
+        i = j
+    if zeros:
+        steps.append((zeros, 0))
+    return steps
+
+
+def sliding_window_power(g: int, steps: list[tuple[int, int]],
+                         mod: int) -> int:
+    """
+    Raise g to the exponent described by a sliding window schedule. A table
+    of the odd powers g, g^3, g^5, ... is built for the windows in use.
+    """
+    if not steps:
+        return 1 % mod
+
+    g %= mod
+    g_squared = g * g % mod
+    largest = max(value for _, value in steps)
+    table = [g]
+    for _ in range(largest // 2):
+        table.append(table[-1] * g_squared % mod)
+
+    # The first window sets the result, no squarings of 1 are needed.
+    result = table[steps[0][1] >> 1]
+    for squarings, value in steps[1:]:
+        for _ in range(squarings):
+            result = result * result % mod
+        if value:
+            result = result * table[value >> 1] % mod
+    return result
+
+
+class SigningKey:
+    """
+    A signing key precomputes dp, dq, qinv and the sliding window schedules
+    of dp and dq once, so each signature is two half size exponentiations.
+    """
+    def __init__(self, private_key: rsa.RSAPrivateKey, window: int = 5) -> None:
+        numbers = private_key.private_numbers()
+        self.p = numbers.p
+        self.q = numbers.q
+        self.n = numbers.public_numbers.n
+        self.dp = numbers.dmp1
+        self.dq = numbers.dmq1
+        self.qinv = numbers.iqmp
+        self.dp_steps = sliding_window_schedule(self.dp, window)
+        self.dq_steps = sliding_window_schedule(self.dq, window)
+
+    def sign(self, message: str) -> int:
+        """
+        The same signature as digital_signature, hash^d mod n, recombined
+        from hash^dp mod p and hash^dq mod q.
+        """
+        sha3_hash = hashlib.sha3_256(message.encode()).digest()
+        hash_int = int.from_bytes(sha3_hash, byteorder='big')
+        m1 = sliding_window_power(hash_int, self.dp_steps, self.p)
+        m2 = sliding_window_power(hash_int, self.dq_steps, self.q)
+        h = self.qinv * (m1 - m2) % self.p
+        return m2 + h * self.q
+
+
+def benchmark_signatures(private_key: rsa.RSAPrivateKey,
+                         count: int = 20) -> dict[str, float]:
+    """
+    Sign count messages with fast_power, with the CRT signing key, and with
+    the built in pow, returning signatures per second for each.
+    """
+    numbers = private_key.private_numbers()
+    mod = numbers.public_numbers.n
+    signing_key = SigningKey(private_key)
+    messages = [f'message {i}' for i in range(count)]
+
+    def hash_of(message: str) -> int:
+        return int.from_bytes(hashlib.sha3_256(message.encode()).digest(),
+                              byteorder='big')
+
+    def pow_crt(message: str) -> int:
+        hash_int = hash_of(message)
+        m1 = pow(hash_int, signing_key.dp, signing_key.p)
+        m2 = pow(hash_int, signing_key.dq, signing_key.q)
+        h = signing_key.qinv * (m1 - m2) % signing_key.p
+        return m2 + h * signing_key.q
+
+    candidates = {
+        'fast_power (d mod n)':
+            lambda m: digital_signature(m, numbers.d, mod),
+        'SigningKey.sign (CRT)': signing_key.sign,
+        'pow (d mod n)': lambda m: pow(hash_of(m), numbers.d, mod),
+        'pow (CRT)': pow_crt,
+    }
+
+    results = {}
+    expected = None
+    for name, sign in candidates.items():
+        start = time.perf_counter()
+        signatures = [sign(m) for m in messages]
+        results[name] = count / (time.perf_counter() - start)
+        if expected is None:
+            expected = signatures
+        assert signatures == expected, name
+        print(f'{name:<24} {results[name]:10.1f} signatures/s')
+    return results
+
+
+"""
+Many signatures may be verified in one pass. Messages are hashed on a thread
+pool in one slice per thread, since hashlib releases the GIL while hashing
+large buffers, and the exponentiations signature^e mod n are spread across
+processes in chunks. The workers run under any multiprocessing start method.
+
+Pairs are consumed lazily and only a few chunks are in flight at a time, so
+results stream back in order for inputs too large to hold in memory.
+"""
+
+
+def hash_to_int(message: str | bytes) -> int:
+    if isinstance(message, str):
+        message = message.encode()
+    return int.from_bytes(hashlib.sha3_256(message).digest(), byteorder='big')
+
+
+def hash_slice(messages: tuple[str | bytes, ...]) -> list[int]:
+    return [hash_to_int(message) for message in messages]
+
+
+def verify_chunk(chunk: tuple[list[int], list[int], int, int]) -> list[bool]:
+    # Run in a worker process, compare each signature^e to its message hash.
+    hashes, signatures, public_key, mod = chunk
+    return [pow(signature, public_key, mod) == hash_int
+            for hash_int, signature in zip(hashes, signatures)]
+
+
+def verify_stream(pairs: Iterable[tuple[str | bytes, int]], public_key: int,
+                  mod: int, chunk_size: int = 4096,
+                  processes: int | None = None,
+                  threads: int | None = None) -> Iterator[bool]:
+    """
+    Verify (message, signature) pairs, yielding True or False for each
+    pair in input order.
+    """
+    processes = processes or os.cpu_count() or 1
+    threads = threads or os.cpu_count() or 1
+    verify = process_worker(verify_chunk)
+    pairs = iter(pairs)
+    pending = deque()
+
+    with ThreadPoolExecutor(threads) as hash_pool, \
+            ProcessPoolExecutor(processes) as exponent_pool:
+        while True:
+            chunk = list(itertools.islice(pairs, chunk_size))
+            if chunk:
+                messages, signatures = zip(*chunk)
+                step = -(-len(messages) // threads)
+                slices = [messages[i:i + step]
+                          for i in range(0, len(messages), step)]
+                hashes = [hash_int for hashed in hash_pool.map(hash_slice,
+                                                               slices)
+                          for hash_int in hashed]
+                pending.append(exponent_pool.submit(
+                    verify, (hashes, list(signatures), public_key, mod)))
+
+            # Keep at most two chunks per process in flight.
+            if pending and (not chunk or len(pending) >= 2 * processes):
+                yield from pending.popleft().result()
+            if not chunk and not pending:
+                return
+
+
+def verify_batch(pairs: Iterable[tuple[str | bytes, int]], public_key: int,
+                 mod: int, **options) -> tuple[list[bool], list[int]]:
+    """
+    Verify a batch of (message, signature) pairs, returning a list with
+    one boolean per pair and the indices of the pairs that failed.
+    """
+    results = list(verify_stream(pairs, public_key, mod, **options))
+    failures = [index for index, valid in enumerate(results) if not valid]
+    return results, failures
+
+
+if __name__ == '__main__':
+    benchmark_import_time(__file__)
+    benchmark_signatures(example_private_key())
@@ -1,4 +1,7 @@
+import functools
 import hashlib
+import hmac
+from collections.abc import Iterable
 
 
 def sha_3_256(string: str) -> str:
@@ -40,32 +43,98 @@ def h_mac(message: str, secret_key: str) -> str:
     Concatenate key1 with the message, and hash this to form hash1.
     Concatenate key2 with the hash1, and hash this to form the HMAC.
     """
-    key = secret_key.encode()
-    if len(key) < 64:
-        key = key.ljust(64, b'\x00')
-    if len(key) > 64:
-        key = hashlib.sha256(key).digest()
-        key = key.ljust(64, b'\x00')
+    return hmac_context(secret_key).hexdigest(message)
 
-    key1 = bytes([k ^ 0x36 for k in key])
-    key2 = bytes([k ^ 0x5C for k in key])
 
-    hash1 = hashlib.sha256(key1 + message.encode()).digest()
-    hash2 = hashlib.sha256(key2 + hash1).hexdigest()
-    return hash2
+class HMACContext:
+    """
+    The key only enters the HMAC through the 64 byte blocks key1 and key2,
+    which are always the first block hashed by the inner and outer hashes.
+
+    A context hashes these two blocks once, each message then starts from a
+    copy of the precomputed inner and outer hash states.
+    """
+    def __init__(self, secret_key: str | bytes) -> None:
+        key = secret_key.encode() if isinstance(secret_key, str) \
+            else bytes(secret_key)
+        if len(key) < 64:
+            key = key.ljust(64, b'\x00')
+        if len(key) > 64:
+            key = hashlib.sha256(key).digest()
+            key = key.ljust(64, b'\x00')
+
+        key1 = bytes([k ^ 0x36 for k in key])
+        key2 = bytes([k ^ 0x5C for k in key])
+
+        self._inner = hashlib.sha256(key1)
+        self._outer = hashlib.sha256(key2)
+
+    def digest(self, message: str | bytes) -> bytes:
+        if isinstance(message, str):
+            message = message.encode()
+        inner = self._inner.copy()
+        inner.update(message)
+        outer = self._outer.copy()
+        outer.update(inner.digest())
+        return outer.digest()
+
+    def hexdigest(self, message: str | bytes) -> str:
+        return self.digest(message).hex()
+
+    def digest_chunks(self, chunks: Iterable[bytes]) -> bytes:
+        # As digest, for a message given in pieces, such as file chunks.
+        inner = self._inner.copy()
+        for chunk in chunks:
+            inner.update(chunk)
+        outer = self._outer.copy()
+        outer.update(inner.digest())
+        return outer.digest()
+
+    def verify(self, message: str | bytes, expected_hash: str | bytes) -> bool:
+        # Compare raw digests in constant time, so timing leaks no prefix.
+        return constant_time_equal(self.digest(message), expected_hash)
+
+
+# Number of keyed contexts kept, least recently used keys are evicted first.
+HMAC_CONTEXT_CACHE_SIZE = 64
+
+
+def hmac_context(secret_key: str | bytes | bytearray) -> HMACContext:
+    # Bytearray keys are not hashable, they are cached by their bytes.
+    if not isinstance(secret_key, str):
+        secret_key = bytes(secret_key)
+    return cached_hmac_context(secret_key)
+
+
+@functools.lru_cache(maxsize=HMAC_CONTEXT_CACHE_SIZE)
+def cached_hmac_context(secret_key: str | bytes) -> HMACContext:
+    return HMACContext(secret_key)
+
+
+def constant_time_equal(digest: bytes, expected_hash: str | bytes) -> bool:
+    """
+    Expected hashes may be given in hex, they are decoded to raw bytes and
+    compared with hmac.compare_digest, whose running time does not depend
+    on where the first differing byte is.
+    """
+    if isinstance(expected_hash, str):
+        try:
+            expected_hash = bytes.fromhex(expected_hash)
+        except ValueError:
+            return False
+    return hmac.compare_digest(digest, expected_hash)
 
 
 def mac_verification(plaintext: str, key: str, expected_hash: str) -> str:
-    generated_hash_value = mac(plaintext, key)
-    if generated_hash_value == expected_hash:
+    generated_digest = bytes.fromhex(mac(plaintext, key))
+    if constant_time_equal(generated_digest, expected_hash):
         return 'MAC is valid.'
     else:
         return 'MAC is invalid.'
 
 
 def h_mac_verification(plaintext: str, key: str, expected_hash: str) -> str:
-    generated_hash_value = h_mac(plaintext, key)
-    if generated_hash_value == expected_hash:
+    if hmac_context(key).verify(plaintext, expected_hash):
         return 'HMAC is valid.'
     else:
         return 'HMAC is invalid.'
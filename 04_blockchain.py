@@ -1,42 +1,576 @@
+import os
+import json
+import mmap
 import time
+import shutil
+import struct
 import hashlib
+import tempfile
+import multiprocessing
+from collections import deque
+from collections.abc import Iterable, Iterator, Sequence
+from concurrent.futures import ProcessPoolExecutor
+
+from modern_cryptography import (collect_results, doubling_counts,
+                                  process_worker)
 
 
 class Block:
     # A block is a collection of a data, a timestamp and the previous hash.
-    def __init__(self, data: str, prev_hash: str = '') -> None:
-        self.data = data
-        self.timestamp = time.time()
-        self.prev_hash = prev_hash
+    # Its own hash is computed once, the block is frozen after construction.
+    # A mined block has a nonce making its hash meet the difficulty target,
+    # the nonce is only hashed for mined blocks, those with a difficulty.
+    __slots__ = ('data', 'timestamp', 'prev_hash', 'nonce', 'difficulty',
+                 'hash')
+
+    def __init__(self, data: str, prev_hash: str = '',
+                 timestamp: float | None = None, nonce: int = 0,
+                 difficulty: int = 0) -> None:
+        if timestamp is None:
+            timestamp = time.time()
+        object.__setattr__(self, 'data', data)
+        object.__setattr__(self, 'timestamp', timestamp)
+        object.__setattr__(self, 'prev_hash', prev_hash)
+        object.__setattr__(self, 'nonce', nonce)
+        object.__setattr__(self, 'difficulty', difficulty)
+        object.__setattr__(self, 'hash', self.calculate_hash())
+
+    def __setattr__(self, name: str, value: object) -> None:
+        raise AttributeError('Blocks cannot be modified once created.')
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError('Blocks cannot be modified once created.')
+
+    def fields(self) -> tuple[float, str, str, bytes, int, int]:
+        # The fields checked by validate_range, with the data as bytes.
+        return (self.timestamp, self.hash, self.prev_hash, self.data.encode(),
+                self.nonce, self.difficulty)
+
+    @staticmethod
+    def header_prefix(timestamp: float, data: bytes, prev_hash: str) -> bytes:
+        # Everything hashed before the nonce, fixed while mining.
+        return b'%s%s%s' % (str(timestamp).encode(), data, prev_hash.encode())
 
     def calculate_hash(self) -> str:
         # Chain structure comes from the hashing of the entire previous block.
-        block_string = f"{self.timestamp}{self.data}{self.prev_hash}"
-        return hashlib.sha256(block_string.encode()).hexdigest()
+        block_string = self.header_prefix(self.timestamp, self.data.encode(),
+                                          self.prev_hash)
+        if self.difficulty:
+            block_string += b'%d' % self.nonce
+        return hashlib.sha256(block_string).hexdigest()
+
+    @classmethod
+    def mine(cls, data: str, prev_hash: str, difficulty: int,
+             workers: int | None = None) -> tuple['Block', dict]:
+        """
+        Create a block whose hash has difficulty leading zero bits, searching
+        for the nonce on worker processes. Returns the block and the mining
+        statistics of mine_nonce.
+        """
+        timestamp = time.time()
+        prefix = cls.header_prefix(timestamp, data.encode(), prev_hash)
+        nonce, stats = mine_nonce(prefix, difficulty, workers)
+        return cls(data, prev_hash, timestamp, nonce, difficulty), stats
+
+
+def meets_difficulty(block_hash: str, difficulty: int) -> bool:
+    # The hash, read as a 256 bit number, must have difficulty leading zeros.
+    return int(block_hash, 16) >> (256 - difficulty) == 0
+
+
+"""
+Proof of work asks for a nonce such that the block hash falls below a target,
+here 2^(256 - difficulty). No better method than trying nonces is known, so
+the expected work doubles with each unit of difficulty.
+
+The nonce space is split into disjoint ranges, worker w of W tries the ranges
+k * W + w for k = 0, 1, 2, ... The header prefix before the nonce is hashed
+once, and each nonce only continues a copy of that midstate. The first
+worker to find a nonce sets a shared event, which stops the others.
+"""
+
+
+def mine_worker(prefix: bytes, target: int, worker: int, workers: int,
+                batch: int, stop, results) -> None:
+    midstate = hashlib.sha256(prefix)
+    hashes = 0
+    found = None
+    start = time.perf_counter()
+
+    k = 0
+    while found is None and not stop.is_set():
+        first = (k * workers + worker) * batch
+        for nonce in range(first, first + batch):
+            candidate = midstate.copy()
+            candidate.update(b'%d' % nonce)
+            if int.from_bytes(candidate.digest(), 'big') < target:
+                found = nonce
+                stop.set()
+                break
+        hashes += (found - first + 1) if found is not None else batch
+        k += 1
+
+    results.put((worker, found, hashes, time.perf_counter() - start))
+
+
+def mine_nonce(prefix: bytes, difficulty: int, workers: int | None = None,
+               batch: int = 10_000) -> tuple[int, dict]:
+    """
+    Search for a nonce across worker processes. Returns the nonce and the
+    statistics, the hash rate in hashes per second of each worker and in
+    total. Raises RuntimeError if a worker process dies.
+    """
+    workers = workers or os.cpu_count() or 1
+    target = 1 << (256 - difficulty)
+    stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+
+    start = time.perf_counter()
+    processes = [multiprocessing.Process(
+        target=process_worker(mine_worker),
+        args=(prefix, target, worker, workers, batch, stop, results))
+        for worker in range(workers)]
+    for process in processes:
+        process.start()
+
+    reports = sorted(collect_results(results, processes))
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.join()
+
+    nonce = min(found for _, found, _, _ in reports if found is not None)
+    total_hashes = sum(hashes for _, _, hashes, _ in reports)
+    stats = {
+        'nonce': nonce,
+        'elapsed': elapsed,
+        'total_hashes': total_hashes,
+        'hash_rate': total_hashes / elapsed,
+        'workers': [{'worker': worker, 'hashes': hashes,
+                     'hash_rate': hashes / seconds if seconds else 0.0}
+                    for worker, _, hashes, seconds in reports],
+    }
+    return nonce, stats
+
+
+INDEX_MAGIC = b'BLKI'
+INDEX_VERSION = 2
+
+
+class BlockStore(Sequence):
+    """
+    Append only storage of blocks on disk.
+
+    Block data is appended to segment files of at most segment_size bytes.
+    A side index starts with a magic and a format version, followed by one
+    fixed size header per block, the timestamp, hash, previous hash, segment
+    number, data offset, data length, nonce and difficulty. The header of
+    block h is found at preamble size + h * header size, so reopening a
+    store only maps the files into memory and blocks are read back when
+    they are indexed. An index of another format is refused.
+
+    Appends are written in batches of batch_size blocks. The fsync policy is
+    'batch' to sync every batch, 'close' to sync once on closing, or 'never'.
+    """
+    preamble = struct.Struct('<4sI')
+    header = struct.Struct('<d64s64sIQIQB')
+
+    def __init__(self, directory: str, segment_size: int = 1 << 26,
+                 batch_size: int = 1024, fsync: str = 'batch') -> None:
+        if fsync not in ('batch', 'close', 'never'):
+            raise ValueError("fsync must be 'batch', 'close' or 'never'.")
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_size = segment_size
+        self.batch_size = batch_size
+        self.fsync = fsync
+
+        index_path = os.path.join(directory, 'index.dat')
+        self._index_file = open(index_path, 'ab')
+        if self._index_file.tell() < self.preamble.size:
+            # A new index, or one whose preamble was only partly written.
+            self._index_file.truncate(0)
+            self._index_file.write(self.preamble.pack(INDEX_MAGIC,
+                                                      INDEX_VERSION))
+            self._index_file.flush()
+        else:
+            with open(index_path, 'rb') as file:
+                magic, version = self.preamble.unpack(
+                    file.read(self.preamble.size))
+            if magic != INDEX_MAGIC or version != INDEX_VERSION:
+                self._index_file.close()
+                raise ValueError(f'{index_path} is not a version '
+                                 f'{INDEX_VERSION} block store index.')
+
+        # A header only partly written before a crash is dropped.
+        used = self._index_file.tell() - self.preamble.size
+        self._stored = used // self.header.size
+        self._index_file.truncate(self.preamble.size
+                                  + self._stored * self.header.size)
+        self._index_map = None
+        self._mapped = 0
+        self._segment_maps: dict[int, mmap.mmap] = {}
+
+        self._segment = 0
+        if self._stored:
+            self._segment = self._read_header(self._stored - 1)[3]
+        self._segment_file = open(self._segment_path(self._segment), 'ab')
+        self._segment_used = self._segment_file.tell()
+
+        self._pending_blocks: list[Block] = []
+        self._pending_data: list[bytes] = []
+        self._pending_headers: list[bytes] = []
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f'segment_{segment:05d}.dat')
+
+    def __len__(self) -> int:
+        return self._stored + len(self._pending_blocks)
+
+    def __getitem__(self, height: int) -> Block:
+        if height < 0:
+            height += len(self)
+        if not 0 <= height < len(self):
+            raise IndexError('Block height out of range.')
+        if height >= self._stored:
+            return self._pending_blocks[height - self._stored]
+
+        timestamp, _, prev_hash, segment, offset, length, nonce, difficulty = \
+            self._read_header(height)
+        data = b''
+        if length:
+            segment_map = self._read_segment(segment, offset + length)
+            data = segment_map[offset:offset + length]
+        return Block(data.decode(), prev_hash.rstrip(b'\x00').decode(),
+                     timestamp, nonce, difficulty)
+
+    def block_fields(self, start: int, end: int) -> list[tuple]:
+        """
+        The fields of Block.fields for blocks start to end, read from the
+        headers and segments without creating blocks or hashing them.
+        """
+        fields = []
+        for height in range(start, min(end, self._stored)):
+            timestamp, block_hash, prev_hash, segment, offset, length, \
+                nonce, difficulty = self._read_header(height)
+            data = b''
+            if length:
+                segment_map = self._read_segment(segment, offset + length)
+                data = segment_map[offset:offset + length]
+            fields.append((timestamp, block_hash.decode(),
+                           prev_hash.rstrip(b'\x00').decode(), data, nonce,
+                           difficulty))
+        if end > self._stored:
+            pending = self._pending_blocks[max(start - self._stored, 0):
+                                           end - self._stored]
+            fields.extend(block.fields() for block in pending)
+        return fields
+
+    def block_hashes(self) -> Iterator[str]:
+        # Hashes are read from the headers, without deserialising blocks.
+        for height in range(self._stored):
+            yield self._read_header(height)[1].decode()
+        for block in self._pending_blocks:
+            yield block.hash
+
+    def _read_header(self, height: int) -> tuple:
+        if height >= self._mapped:
+            if self._index_map is not None:
+                self._index_map.close()
+            with open(os.path.join(self.directory, 'index.dat'), 'rb') as file:
+                self._index_map = mmap.mmap(file.fileno(), 0,
+                                            access=mmap.ACCESS_READ)
+            self._mapped = ((len(self._index_map) - self.preamble.size)
+                            // self.header.size)
+        return self.header.unpack_from(
+            self._index_map, self.preamble.size + height * self.header.size)
+
+    def _read_segment(self, segment: int, end: int) -> mmap.mmap:
+        # Segments are mapped on first use, and remapped once they grow.
+        segment_map = self._segment_maps.get(segment)
+        if segment_map is None or len(segment_map) < end:
+            if segment_map is not None:
+                segment_map.close()
+            with open(self._segment_path(segment), 'rb') as file:
+                segment_map = mmap.mmap(file.fileno(), 0,
+                                        access=mmap.ACCESS_READ)
+            self._segment_maps[segment] = segment_map
+        return segment_map
+
+    def append(self, block: Block) -> None:
+        data = block.data.encode()
+        if self._segment_used and \
+                self._segment_used + len(data) > self.segment_size:
+            self._next_segment()
+
+        self._pending_blocks.append(block)
+        self._pending_data.append(data)
+        self._pending_headers.append(self.header.pack(
+            block.timestamp, block.hash.encode(), block.prev_hash.encode(),
+            self._segment, self._segment_used, len(data), block.nonce,
+            block.difficulty))
+        self._segment_used += len(data)
+
+        if len(self._pending_blocks) >= self.batch_size:
+            self.flush()
+
+    def _next_segment(self) -> None:
+        self.flush()
+        self._segment_file.close()
+        self._segment += 1
+        self._segment_file = open(self._segment_path(self._segment), 'ab')
+        self._segment_used = 0
+
+    def flush(self) -> None:
+        """
+        Write pending blocks, data before headers, so a header on disk
+        never refers to data that is missing.
+        """
+        if not self._pending_blocks:
+            return
+        self._segment_file.write(b''.join(self._pending_data))
+        self._segment_file.flush()
+        self._index_file.write(b''.join(self._pending_headers))
+        self._index_file.flush()
+        if self.fsync == 'batch':
+            self._sync()
+
+        self._stored += len(self._pending_blocks)
+        self._pending_blocks.clear()
+        self._pending_data.clear()
+        self._pending_headers.clear()
+
+    def _sync(self) -> None:
+        os.fsync(self._segment_file.fileno())
+        os.fsync(self._index_file.fileno())
+
+    def load_checkpoints(self) -> list[tuple[int, str]]:
+        path = os.path.join(self.directory, 'checkpoints.json')
+        if not os.path.exists(path):
+            return []
+        with open(path) as file:
+            return [(height, block_hash) for height, block_hash in
+                    json.load(file)]
+
+    def save_checkpoints(self, checkpoints: list[tuple[int, str]]) -> None:
+        # Written to a temporary file first, so a crash leaves the old file.
+        path = os.path.join(self.directory, 'checkpoints.json')
+        with open(path + '.tmp', 'w') as file:
+            json.dump(checkpoints, file)
+        os.replace(path + '.tmp', path)
+
+    def close(self) -> None:
+        self.flush()
+        if self.fsync != 'never':
+            self._sync()
+        self._segment_file.close()
+        self._index_file.close()
+        if self._index_map is not None:
+            self._index_map.close()
+        for segment_map in self._segment_maps.values():
+            segment_map.close()
+        self._segment_maps.clear()
+
+    def __enter__(self) -> 'BlockStore':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
 
 
 class Blockchain:
     # Define a blockchain as an empty array with a genesis block appended.
-    def __init__(self) -> None:
-        self.chain: list[Block] = []
-        self.create_genesis_block()
+    # A dictionary maps each block hash to its height in the chain.
+    # The chain may instead be kept on disk in a block store, the heights of
+    # a reopened store are then read from its headers on the first lookup.
+    # Checkpoints are (height, hash) pairs of blocks that have been validated.
+    def __init__(self, store: BlockStore | None = None) -> None:
+        self.chain: list[Block] | BlockStore = [] if store is None else store
+        self.heights: dict[str, int] | None = None if self.chain else {}
+        self.checkpoints: list[tuple[int, str]] = \
+            [] if store is None else store.load_checkpoints()
+        if not self.chain:
+            self.create_genesis_block()
 
     def create_genesis_block(self) -> None:
         genesis_block = Block('Genesis Block', '0')
-        self.chain.append(genesis_block)
+        self.append(genesis_block)
+
+    def append(self, block: Block) -> None:
+        if self.heights is not None:
+            self.heights[block.hash] = len(self.chain)
+        self.chain.append(block)
 
     def add_block(self, data: str) -> None:
         # A method to add new blocks to the chain.
         last_block = self.chain[-1]
-        prev_hash = last_block.calculate_hash()
-        new_block = Block(data, prev_hash)
-        self.chain.append(new_block)
+        new_block = Block(data, last_block.hash)
+        self.append(new_block)
+
+    def add_blocks(self, data_items: Iterable[str]) -> None:
+        # Each new block links to the cached hash of the block before it.
+        prev_hash = self.chain[-1].hash
+        for data in data_items:
+            new_block = Block(data, prev_hash)
+            self.append(new_block)
+            prev_hash = new_block.hash
+
+    def mine_block(self, data: str, difficulty: int,
+                   workers: int | None = None) -> dict:
+        # Add a block with proof of work, returning the mining statistics.
+        new_block, stats = Block.mine(data, self.chain[-1].hash, difficulty,
+                                      workers)
+        self.append(new_block)
+        return stats
+
+    def get_block(self, block_hash: str) -> Block | None:
+        if self.heights is None:
+            self.heights = {h: i for i, h in
+                            enumerate(self.chain.block_hashes())}
+        height = self.heights.get(block_hash)
+        return None if height is None else self.chain[height]
+
+    def validate(self, processes: int | None = None,
+                 chunk_size: int = 10_000) -> int | None:
+        """
+        Check that every block links to the hash of the block before it,
+        and that mined blocks meet their difficulty, returning the height of
+        the first bad block, or None.
+
+        Blocks from the last checkpoint onwards are split into ranges. The
+        raw fields of each range, read from the block store headers and
+        segments, are hashed and checked in a worker process, and the ranges
+        are stitched together by comparing each range's first previous hash
+        to the last hash of the range before. A valid chain gains a
+        checkpoint at its last block, so the next validation starts there.
+        """
+        start, prev_hash = 0, None
+        if self.checkpoints:
+            height, trusted_hash = self.checkpoints[-1]
+            if self.chain[height].calculate_hash() != trusted_hash:
+                return height
+            start, prev_hash = height + 1, trusted_hash
+
+        processes = processes or os.cpu_count() or 1
+        validate = process_worker(validate_range)
+        ranges = iter(range(start, len(self.chain), chunk_size))
+        pending = deque()
+
+        with ProcessPoolExecutor(processes) as executor:
+            while True:
+                range_start = next(ranges, None)
+                if range_start is not None:
+                    range_end = min(range_start + chunk_size, len(self.chain))
+                    if isinstance(self.chain, BlockStore):
+                        fields = self.chain.block_fields(range_start,
+                                                         range_end)
+                    else:
+                        fields = [block.fields() for block in
+                                  self.chain[range_start:range_end]]
+                    pending.append((range_start,
+                                    executor.submit(validate, fields)))
+
+                # Keep at most two ranges per process in flight.
+                if pending and (range_start is None
+                                or len(pending) >= 2 * processes):
+                    checked_start, future = pending.popleft()
+                    bad_offset, first_prev_hash, last_hash = future.result()
+                    if prev_hash is not None and first_prev_hash != prev_hash:
+                        executor.shutdown(cancel_futures=True)
+                        return checked_start
+                    if bad_offset is not None:
+                        executor.shutdown(cancel_futures=True)
+                        return checked_start + bad_offset
+                    prev_hash = last_hash
+                elif range_start is None:
+                    break
+
+        last_height = len(self.chain) - 1
+        if not self.checkpoints or self.checkpoints[-1][0] < last_height:
+            self.checkpoints.append((last_height, prev_hash))
+            if isinstance(self.chain, BlockStore):
+                self.chain.save_checkpoints(self.checkpoints)
+        return None
+
+
+def validate_range(blocks: list[tuple[float, str, str, bytes, int, int]]
+                   ) -> tuple[int | None, str, str]:
+    """
+    Run in a worker process. Hash each (timestamp, hash, prev_hash, data,
+    nonce, difficulty) block, and check the result against the stored hash,
+    the previous hash of the next block and the proof of work. Returns the
+    offset of the first bad block, or None, the first block's previous hash
+    and the last hash.
+    """
+    prev_hash = None
+    for offset, (timestamp, stored_hash, block_prev_hash, data, nonce,
+                 difficulty) in enumerate(blocks):
+        if prev_hash is not None and block_prev_hash != prev_hash:
+            return offset, blocks[0][2], prev_hash
+        block_string = Block.header_prefix(timestamp, data, block_prev_hash)
+        if difficulty:
+            block_string += b'%d' % nonce
+        prev_hash = hashlib.sha256(block_string).hexdigest()
+        if prev_hash != stored_hash:
+            return offset, blocks[0][2], prev_hash
+        if difficulty and not meets_difficulty(prev_hash, difficulty):
+            return offset, blocks[0][2], prev_hash
+    return None, blocks[0][2], prev_hash
+
+
+def benchmark_block_store(blocks: int = 100_000,
+                          fsync: str = 'batch') -> dict[str, float]:
+    """
+    Append blocks to a new block store, then time a cold open of the store
+    and a read of its last block. Returns the append rate in blocks per
+    second and the open time in seconds.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        with BlockStore(directory, fsync=fsync) as store:
+            Blockchain(store).add_blocks(f'Block {i}' for i in range(blocks))
+        append_rate = blocks / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with BlockStore(directory) as store:
+            last_block = Blockchain(store).chain[-1]
+            open_time = time.perf_counter() - start
+        assert last_block.data == f'Block {blocks - 1}'
+    finally:
+        shutil.rmtree(directory)
+
+    print(f'Append rate: {append_rate:12,.0f} blocks/s')
+    print(f'Cold open:   {open_time * 1000:12.3f} ms')
+    return {'append_rate': append_rate, 'open_time': open_time}
+
+
+def benchmark_mining(difficulty: int = 18,
+                     max_workers: int | None = None) -> list[dict]:
+    """
+    Mine one block for each worker count from 1 up to max_workers, doubling
+    each time, and report the hash rate per worker and in total.
+    """
+    results = []
+    for workers in doubling_counts(max_workers):
+        block, stats = Block.mine('Benchmark', '0', difficulty, workers)
+        assert meets_difficulty(block.hash, difficulty)
+        per_worker = ', '.join(f"{w['hash_rate']:,.0f}"
+                               for w in stats['workers'])
+        print(f'{workers:3d} workers: {stats["hash_rate"]:12,.0f} H/s total '
+              f'({per_worker} H/s per worker)')
+        results.append(stats)
+    return results
+
 
+if __name__ == '__main__':
+    blockchain = Blockchain()
+    blockchain.add_block('Block 1')
+    blockchain.add_block('Block 2')
 
-blockchain = Blockchain()
-blockchain.add_block('Block 1')
-blockchain.add_block('Block 2')
+    for block in blockchain.chain:
+        print(f'Data: {block.data}, Time: {block.timestamp}, '
+              f'Previous Hash: {block.prev_hash}')
 
-for block in blockchain.chain:
-    print(f'Data: {block.data}, Time: {block.timestamp}, '
-          f'Previous Hash: {block.prev_hash}')
+    benchmark_block_store()
+    benchmark_mining()
@@ -1,6 +1,23 @@
+import os
+import hmac
+import json
+import time
+import queue
+import struct
+import asyncio
+import functools
+import contextlib
+import threading
+import statistics
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
 from Crypto.Random import random
-from Crypto.Util.number import getPrime
-from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, x25519
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from modern_cryptography import CACHE_DIR, collect_results, process_worker
 
 """
 The Diffie-Hellman and elliptic curve Diffie-Hellman key exchange algorithms
@@ -16,16 +33,386 @@ public values, due to the NP nature of the discrete logarithm problem.
 """
 
 
-def diffie_hellman_key_exchange(prime_size: int) -> tuple[int, int]:
+"""
+Primes are found by testing random odd numbers. Most candidates have a small
+prime factor, so a window of consecutive candidates is first sieved by the
+primes below 2000, and only the survivors are tested with Miller-Rabin.
+
+A safe prime p = 2q + 1 also needs q prime. q has a factor s exactly when
+p = 1 mod s, so the sieve also removes those candidates.
+
+Several worker processes may search from different random starting points,
+the first to find a prime sets a shared event, which stops the others.
+"""
+
+
+def small_primes(limit: int) -> list[int]:
+    # Sieve of Eratosthenes.
+    sieve = bytearray([1]) * limit
+    sieve[:2] = b'\x00\x00'
+    for i in range(2, int(limit ** 0.5) + 1):
+        if sieve[i]:
+            sieve[i * i::i] = bytes(len(range(i * i, limit, i)))
+    return [i for i in range(limit) if sieve[i]]
+
+
+SMALL_PRIMES = small_primes(2000)
+
+
+def is_probable_prime(n: int, rounds: int = 40) -> bool:
+    """
+    Trial division by the small primes, then Miller-Rabin. Write n - 1 as
+    2^s * d, a composite n fails for at least 3/4 of the random bases a,
+    meaning a^d is not 1 and no a^(2^r * d) for r < s is -1 mod n.
+    """
+    if n < 2:
+        return False
+    for p in SMALL_PRIMES:
+        if n % p == 0:
+            return n == p
+
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+
+    for _ in range(rounds):
+        x = pow(random.randint(2, n - 2), d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def search_prime(bits: int, safe: bool, stop=None,
+                 window: int = 4096) -> int | None:
+    """
+    Search windows of consecutive candidates upwards from a random start,
+    returning a prime of the given bit length, or None once stop is set.
+    The last window below 2^bits is cut short, and the search then restarts
+    from a new random start.
+    """
+    # Safe primes are 3 mod 4, since q = (p - 1) / 2 must be odd.
+    step = 4 if safe else 2
+    limit = 1 << bits
+    start = None
+
+    while stop is None or not stop.is_set():
+        if start is None or start >= limit:
+            start = random.getrandbits(bits) | (1 << (bits - 1)) | 1
+            if safe:
+                start |= 3
+        count = min(window, -(-(limit - start) // step))
+
+        sieve = bytearray([1]) * count
+        for p in SMALL_PRIMES[1:]:
+            if p >= start:
+                break
+            # Offset k of the first candidate start + step * k = 0 mod p.
+            inverse = pow(step, -1, p)
+            first = -start * inverse % p
+            sieve[first::p] = bytes(len(range(first, count, p)))
+            if safe:
+                first = (1 - start) * inverse % p
+                sieve[first::p] = bytes(len(range(first, count, p)))
+
+        for k in range(count):
+            if not sieve[k]:
+                continue
+            candidate = start + step * k
+            if safe:
+                if is_probable_prime((candidate - 1) // 2) and \
+                        is_probable_prime(candidate):
+                    return candidate
+            elif is_probable_prime(candidate):
+                return candidate
+        start += step * count
+    return None
+
+
+def prime_worker(bits: int, safe: bool, stop, results) -> None:
+    prime = search_prime(bits, safe, stop)
+    if prime is not None:
+        stop.set()
+    results.put(prime)
+
+
+def generate_prime(bits: int, safe: bool = False, workers: int = 1) -> int:
+    """
+    A drop in for getPrime, returning a random prime of the given bit length,
+    a safe prime if safe is set. With several workers the search runs on that
+    many processes, stopping the others on the first hit. Raises
+    RuntimeError if a worker process dies.
+    """
+    if workers <= 1:
+        return search_prime(bits, safe)
+
+    stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=process_worker(prime_worker),
+                                         args=(bits, safe, stop, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+
+    found = collect_results(results, processes)
+    for process in processes:
+        process.join()
+    return next(prime for prime in found if prime is not None)
+
+
+def generate_safe_prime(bits: int, workers: int = 1) -> int:
+    return generate_prime(bits, safe=True, workers=workers)
+
+
+def benchmark_prime_generation(sizes: tuple[int, ...] = (512, 1024, 2048),
+                               worker_counts: tuple[int, ...] | None = None,
+                               count: int = 5) -> dict[tuple[int, int], float]:
+    """
+    Generate count primes for each bit size and worker count, returning
+    primes per second for each (bits, workers) pair.
+    """
+    if worker_counts is None:
+        worker_counts = tuple(sorted({1, os.cpu_count() or 1}))
+
+    results = {}
+    for bits in sizes:
+        for workers in worker_counts:
+            start = time.perf_counter()
+            for _ in range(count):
+                assert generate_prime(bits, workers=workers).bit_length() \
+                    == bits
+            results[bits, workers] = count / (time.perf_counter() - start)
+            print(f'{bits:5d} bits, {workers:2d} workers: '
+                  f'{results[bits, workers]:8.2f} primes/s')
+    return results
+
+
+"""
+Generating a 2048 bit prime takes seconds, too slow for every exchange. The
+prime need not be secret, so standard groups are used instead, the safe primes
+of RFC 3526 and RFC 7919, each with generator 2. Primes of other sizes are
+generated once and kept in a cache file.
+
+A key pair pool keeps precomputed (private, generator^private) pairs topped up
+from a background thread, leaving a single modular exponentiation per side.
+"""
+
+
+def hex_words_to_int(words: str) -> int:
+    # Primes are written as in the RFCs, in words of 32 bits.
+    return int(''.join(words.split()), 16)
+
+
+DH_GROUPS: dict[str, tuple[int, int]] = {
+    # RFC 3526 group 14.
+    'modp2048': (2, hex_words_to_int("""
+        FFFFFFFF FFFFFFFF C90FDAA2 2168C234 C4C6628B 80DC1CD1 29024E08 8A67CC74
+        020BBEA6 3B139B22 514A0879 8E3404DD EF9519B3 CD3A431B 302B0A6D F25F1437
+        4FE1356D 6D51C245 E485B576 625E7EC6 F44C42E9 A637ED6B 0BFF5CB6 F406B7ED
+        EE386BFB 5A899FA5 AE9F2411 7C4B1FE6 49286651 ECE45B3D C2007CB8 A163BF05
+        98DA4836 1C55D39A 69163FA8 FD24CF5F 83655D23 DCA3AD96 1C62F356 208552BB
+        9ED52907 7096966D 670C354E 4ABC9804 F1746C08 CA18217C 32905E46 2E36CE3B
+        E39E772C 180E8603 9B2783A2 EC07A28F B5C55DF0 6F4C52C9 DE2BCBF6 95581718
+        3995497C EA956AE5 15D22618 98FA0510 15728E5A 8AACAA68 FFFFFFFF FFFFFFFF
+        """)),
+
+    # RFC 3526 group 15.
+    'modp3072': (2, hex_words_to_int("""
+        FFFFFFFF FFFFFFFF C90FDAA2 2168C234 C4C6628B 80DC1CD1 29024E08 8A67CC74
+        020BBEA6 3B139B22 514A0879 8E3404DD EF9519B3 CD3A431B 302B0A6D F25F1437
+        4FE1356D 6D51C245 E485B576 625E7EC6 F44C42E9 A637ED6B 0BFF5CB6 F406B7ED
+        EE386BFB 5A899FA5 AE9F2411 7C4B1FE6 49286651 ECE45B3D C2007CB8 A163BF05
+        98DA4836 1C55D39A 69163FA8 FD24CF5F 83655D23 DCA3AD96 1C62F356 208552BB
+        9ED52907 7096966D 670C354E 4ABC9804 F1746C08 CA18217C 32905E46 2E36CE3B
+        E39E772C 180E8603 9B2783A2 EC07A28F B5C55DF0 6F4C52C9 DE2BCBF6 95581718
+        3995497C EA956AE5 15D22618 98FA0510 15728E5A 8AAAC42D AD33170D 04507A33
+        A85521AB DF1CBA64 ECFB8504 58DBEF0A 8AEA7157 5D060C7D B3970F85 A6E1E4C7
+        ABF5AE8C DB0933D7 1E8C94E0 4A25619D CEE3D226 1AD2EE6B F12FFA06 D98A0864
+        D8760273 3EC86A64 521F2B18 177B200C BBE11757 7A615D6C 770988C0 BAD946E2
+        08E24FA0 74E5AB31 43DB5BFC E0FD108E 4B82D120 A93AD2CA FFFFFFFF FFFFFFFF
+        """)),
+
+    # RFC 3526 group 16.
+    'modp4096': (2, hex_words_to_int("""
+        FFFFFFFF FFFFFFFF C90FDAA2 2168C234 C4C6628B 80DC1CD1 29024E08 8A67CC74
+        020BBEA6 3B139B22 514A0879 8E3404DD EF9519B3 CD3A431B 302B0A6D F25F1437
+        4FE1356D 6D51C245 E485B576 625E7EC6 F44C42E9 A637ED6B 0BFF5CB6 F406B7ED
+        EE386BFB 5A899FA5 AE9F2411 7C4B1FE6 49286651 ECE45B3D C2007CB8 A163BF05
+        98DA4836 1C55D39A 69163FA8 FD24CF5F 83655D23 DCA3AD96 1C62F356 208552BB
+        9ED52907 7096966D 670C354E 4ABC9804 F1746C08 CA18217C 32905E46 2E36CE3B
+        E39E772C 180E8603 9B2783A2 EC07A28F B5C55DF0 6F4C52C9 DE2BCBF6 95581718
+        3995497C EA956AE5 15D22618 98FA0510 15728E5A 8AAAC42D AD33170D 04507A33
+        A85521AB DF1CBA64 ECFB8504 58DBEF0A 8AEA7157 5D060C7D B3970F85 A6E1E4C7
+        ABF5AE8C DB0933D7 1E8C94E0 4A25619D CEE3D226 1AD2EE6B F12FFA06 D98A0864
+        D8760273 3EC86A64 521F2B18 177B200C BBE11757 7A615D6C 770988C0 BAD946E2
+        08E24FA0 74E5AB31 43DB5BFC E0FD108E 4B82D120 A9210801 1A723C12 A787E6D7
+        88719A10 BDBA5B26 99C32718 6AF4E23C 1A946834 B6150BDA 2583E9CA 2AD44CE8
+        DBBBC2DB 04DE8EF9 2E8EFC14 1FBECAA6 287C5947 4E6BC05D 99B2964F A090C3A2
+        233BA186 515BE7ED 1F612970 CEE2D7AF B81BDD76 2170481C D0069127 D5B05AA9
+        93B4EA98 8D8FDDC1 86FFB7DC 90A6C08F 4DF435C9 34063199 FFFFFFFF FFFFFFFF
+        """)),
+
+    # RFC 7919 ffdhe2048.
+    'ffdhe2048': (2, hex_words_to_int("""
+        FFFFFFFF FFFFFFFF ADF85458 A2BB4A9A AFDC5620 273D3CF1 D8B9C583 CE2D3695
+        A9E13641 146433FB CC939DCE 249B3EF9 7D2FE363 630C75D8 F681B202 AEC4617A
+        D3DF1ED5 D5FD6561 2433F51F 5F066ED0 85636555 3DED1AF3 B557135E 7F57C935
+        984F0C70 E0E68B77 E2A689DA F3EFE872 1DF158A1 36ADE735 30ACCA4F 483A797A
+        BC0AB182 B324FB61 D108A94B B2C8E3FB B96ADAB7 60D7F468 1D4F42A3 DE394DF4
+        AE56EDE7 6372BB19 0B07A7C8 EE0A6D70 9E02FCE1 CDF7E2EC C03404CD 28342F61
+        9172FE9C E98583FF 8E4F1232 EEF28183 C3FE3B1B 4C6FAD73 3BB5FCBC 2EC22005
+        C58EF183 7D1683B2 C6F34A26 C1B2EFFA 886B4238 61285C97 FFFFFFFF FFFFFFFF
+        """)),
+
+    # RFC 7919 ffdhe3072.
+    'ffdhe3072': (2, hex_words_to_int("""
+        FFFFFFFF FFFFFFFF ADF85458 A2BB4A9A AFDC5620 273D3CF1 D8B9C583 CE2D3695
+        A9E13641 146433FB CC939DCE 249B3EF9 7D2FE363 630C75D8 F681B202 AEC4617A
+        D3DF1ED5 D5FD6561 2433F51F 5F066ED0 85636555 3DED1AF3 B557135E 7F57C935
+        984F0C70 E0E68B77 E2A689DA F3EFE872 1DF158A1 36ADE735 30ACCA4F 483A797A
+        BC0AB182 B324FB61 D108A94B B2C8E3FB B96ADAB7 60D7F468 1D4F42A3 DE394DF4
+        AE56EDE7 6372BB19 0B07A7C8 EE0A6D70 9E02FCE1 CDF7E2EC C03404CD 28342F61
+        9172FE9C E98583FF 8E4F1232 EEF28183 C3FE3B1B 4C6FAD73 3BB5FCBC 2EC22005
+        C58EF183 7D1683B2 C6F34A26 C1B2EFFA 886B4238 611FCFDC DE355B3B 6519035B
+        BC34F4DE F99C0238 61B46FC9 D6E6C907 7AD91D26 91F7F7EE 598CB0FA C186D91C
+        AEFE1309 85139270 B4130C93 BC437944 F4FD4452 E2D74DD3 64F2E21E 71F54BFF
+        5CAE82AB 9C9DF69E E86D2BC5 22363A0D ABC52197 9B0DEADA 1DBF9A42 D5C4484E
+        0ABCD06B FA53DDEF 3C1B20EE 3FD59D7C 25E41D2B 66C62E37 FFFFFFFF FFFFFFFF
+        """)),
+
+    # RFC 7919 ffdhe4096.
+    'ffdhe4096': (2, hex_words_to_int("""
+        FFFFFFFF FFFFFFFF ADF85458 A2BB4A9A AFDC5620 273D3CF1 D8B9C583 CE2D3695
+        A9E13641 146433FB CC939DCE 249B3EF9 7D2FE363 630C75D8 F681B202 AEC4617A
+        D3DF1ED5 D5FD6561 2433F51F 5F066ED0 85636555 3DED1AF3 B557135E 7F57C935
+        984F0C70 E0E68B77 E2A689DA F3EFE872 1DF158A1 36ADE735 30ACCA4F 483A797A
+        BC0AB182 B324FB61 D108A94B B2C8E3FB B96ADAB7 60D7F468 1D4F42A3 DE394DF4
+        AE56EDE7 6372BB19 0B07A7C8 EE0A6D70 9E02FCE1 CDF7E2EC C03404CD 28342F61
+        9172FE9C E98583FF 8E4F1232 EEF28183 C3FE3B1B 4C6FAD73 3BB5FCBC 2EC22005
+        C58EF183 7D1683B2 C6F34A26 C1B2EFFA 886B4238 611FCFDC DE355B3B 6519035B
+        BC34F4DE F99C0238 61B46FC9 D6E6C907 7AD91D26 91F7F7EE 598CB0FA C186D91C
+        AEFE1309 85139270 B4130C93 BC437944 F4FD4452 E2D74DD3 64F2E21E 71F54BFF
+        5CAE82AB 9C9DF69E E86D2BC5 22363A0D ABC52197 9B0DEADA 1DBF9A42 D5C4484E
+        0ABCD06B FA53DDEF 3C1B20EE 3FD59D7C 25E41D2B 669E1EF1 6E6F52C3 164DF4FB
+        7930E9E4 E58857B6 AC7D5F42 D69F6D18 7763CF1D 55034004 87F55BA5 7E31CC7A
+        7135C886 EFB4318A ED6A1E01 2D9E6832 A907600A 918130C4 6DC778F9 71AD0038
+        092999A3 33CB8B7A 1A1DB93D 7140003C 2A4ECEA9 F98D0ACC 0A8291CD CEC97DCF
+        8EC9B55A 7F88A46B 4DB5A851 F44182E1 C68A007E 5E655F6A FFFFFFFF FFFFFFFF
+        """)),
+}
+
+# Groups used by size, the RFC 7919 groups are the ones used in TLS.
+DEFAULT_GROUPS = {2048: 'ffdhe2048', 3072: 'ffdhe3072', 4096: 'ffdhe4096'}
+
+
+
+@functools.cache
+def load_custom_groups() -> dict[int, tuple[int, int]]:
+    """
+    Load the saved custom groups, once per process. A group whose prime is
+    not safe is dropped here, so each prime is checked once, not on every
+    lookup. get_group adds new groups to the returned dictionary.
+    """
+    if CACHE_DIR is None:
+        return {}
+    path = os.path.join(CACHE_DIR, 'dh_groups.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        groups = {int(size): (generator, int(prime, 16))
+                  for size, (generator, prime) in json.load(file).items()}
+    return {size: (generator, prime)
+            for size, (generator, prime) in groups.items()
+            if is_probable_prime((prime - 1) // 2)}
+
+
+def save_custom_groups(groups: dict[int, tuple[int, int]]) -> None:
+    # Written to a temporary file first, so a crash leaves the old file.
+    if CACHE_DIR is None:
+        return
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = os.path.join(CACHE_DIR, 'dh_groups.json')
+    with open(path + '.tmp', 'w') as file:
+        json.dump({size: (generator, hex(prime))
+                   for size, (generator, prime) in groups.items()}, file)
+    os.replace(path + '.tmp', path)
+
+
+def get_group(prime_size: int) -> tuple[int, int]:
+    """
+    Return (generator, prime) for a prime size, a standard group if there is
+    one, otherwise a cached group, otherwise a newly generated one. Custom
+    groups use safe primes, a cached group whose prime is not safe is
+    replaced.
+    """
+    if prime_size in DEFAULT_GROUPS:
+        return DH_GROUPS[DEFAULT_GROUPS[prime_size]]
+
+    groups = load_custom_groups()
+    if prime_size not in groups:
+        groups[prime_size] = (2, generate_prime(prime_size, safe=True))
+        save_custom_groups(groups)
+    return groups[prime_size]
+
+
+class KeyPairPool:
+    """
+    A queue of precomputed key pairs for one group, kept full by a background
+    thread. If the pool runs dry, a pair is computed on the spot.
+    """
+    def __init__(self, prime: int, generator: int = 2, size: int = 64) -> None:
+        self.prime = prime
+        self.generator = generator
+        self.pairs: queue.Queue[tuple[int, int]] = queue.Queue(maxsize=size)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._fill, daemon=True)
+        self._thread.start()
+
+    def generate(self) -> tuple[int, int]:
+        private = random.randint(1, self.prime-1)
+        return private, pow(self.generator, private, self.prime)
+
+    def _fill(self) -> None:
+        pair = self.generate()
+        while not self._stop.is_set():
+            try:
+                self.pairs.put(pair, timeout=0.1)
+            except queue.Full:
+                continue
+            pair = self.generate()
+
+    def get(self) -> tuple[int, int]:
+        try:
+            return self.pairs.get_nowait()
+        except queue.Empty:
+            return self.generate()
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def diffie_hellman_key_exchange(prime_size: int,
+                                pool: KeyPairPool | None = None
+                                ) -> tuple[int, int]:
     # Typically use 2048 bit primes.
-    prime = getPrime(prime_size)
-    generator = 2
+    generator, prime = get_group(prime_size)
 
-    alice_private = random.randint(1, prime-1)
-    alice_public = pow(generator, alice_private, prime)
+    if pool is not None and pool.prime == prime:
+        alice_private, alice_public = pool.get()
+        bob_private, bob_public = pool.get()
+    else:
+        alice_private = random.randint(1, prime-1)
+        alice_public = pow(generator, alice_private, prime)
 
-    bob_private = random.randint(1, prime-1)
-    bob_public = pow(generator, bob_private, prime)
+        bob_private = random.randint(1, prime-1)
+        bob_public = pow(generator, bob_private, prime)
 
     alice_shared_key = pow(bob_public, alice_private, prime)
     bob_shared_key = pow(alice_public, bob_private, prime)
@@ -61,3 +448,217 @@ def verify_keys(key1: int, key2: int) -> str:
         return 'Shared keys match.'
     else:
         return 'Shared keys do not match.'
+
+
+"""
+A handshake runs each side on its own, over a stream. The client sends the
+curve and its public key with a random nonce, the server replies with its
+public key and nonce, and both compute the shared secret.
+
+The raw shared secret is not used as a key. HKDF derives a 32 byte session
+key from it, salted with both nonces and bound to the curve id, and the server
+proves it holds the same key by sending an HMAC of the transcript, curve id
+included, which the client checks.
+
+Key generation and exchange run on a thread pool, so the event loop can keep
+many handshakes in flight at once.
+"""
+
+CURVES = {1: 'secp256r1', 2: 'x25519'}
+CURVE_IDS = {name: curve_id for curve_id, name in CURVES.items()}
+
+frame_header = struct.Struct('>BH')
+
+
+def generate_key_pair(curve_name: str) -> tuple[object, bytes]:
+    # Returns the private key and the encoded public key.
+    if curve_name == 'x25519':
+        private_key = x25519.X25519PrivateKey.generate()
+        public_bytes = private_key.public_key().public_bytes(
+            serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    else:
+        private_key = ec.generate_private_key(ec.SECP256R1())
+        public_bytes = private_key.public_key().public_bytes(
+            serialization.Encoding.X962,
+            serialization.PublicFormat.UncompressedPoint)
+    return private_key, public_bytes
+
+
+def derive_session_key(curve_name: str, private_key, peer_public: bytes,
+                       salt: bytes) -> bytes:
+    if curve_name == 'x25519':
+        peer_key = x25519.X25519PublicKey.from_public_bytes(peer_public)
+        shared_key = private_key.exchange(peer_key)
+    else:
+        peer_key = ec.EllipticCurvePublicKey.from_encoded_point(
+            ec.SECP256R1(), peer_public)
+        shared_key = private_key.exchange(ec.ECDH(), peer_key)
+    info = b'handshake session key' + bytes([CURVE_IDS[curve_name]])
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=salt,
+                info=info).derive(shared_key)
+
+
+def key_confirmation(session_key: bytes, transcript: bytes) -> bytes:
+    return hmac.new(session_key, transcript, 'sha256').digest()
+
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple[int, bytes]:
+    curve_id, length = frame_header.unpack(
+        await reader.readexactly(frame_header.size))
+    return curve_id, await reader.readexactly(length)
+
+
+def frame(curve_id: int, payload: bytes) -> bytes:
+    return frame_header.pack(curve_id, len(payload)) + payload
+
+
+class HandshakeServer:
+    """
+    Accepts one handshake per connection, offloading the elliptic curve
+    operations to a thread pool. Session keys are passed to on_session.
+    """
+    def __init__(self, executor: ThreadPoolExecutor | None = None,
+                 on_session=None) -> None:
+        self.executor = executor or ThreadPoolExecutor()
+        self.on_session = on_session
+
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            curve_id, client_hello = await read_frame(reader)
+            curve_name = CURVES[curve_id]
+            client_public = client_hello[:-16]
+            client_nonce = client_hello[-16:]
+
+            private_key, server_public = await loop.run_in_executor(
+                self.executor, generate_key_pair, curve_name)
+            server_nonce = os.urandom(16)
+            session_key = await loop.run_in_executor(
+                self.executor, derive_session_key, curve_name, private_key,
+                client_public, client_nonce + server_nonce)
+
+            transcript = (bytes([curve_id]) + client_hello + server_public
+                          + server_nonce)
+            writer.write(frame(curve_id, server_public + server_nonce
+                               + key_confirmation(session_key, transcript)))
+            await writer.drain()
+            if self.on_session is not None:
+                self.on_session(session_key)
+        except (asyncio.IncompleteReadError, KeyError, ValueError):
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def start(self, host: str = '127.0.0.1',
+                    port: int = 0) -> asyncio.Server:
+        return await asyncio.start_server(self.handle, host, port)
+
+
+async def handshake_client(reader: asyncio.StreamReader,
+                           writer: asyncio.StreamWriter, curve_name: str,
+                           executor: ThreadPoolExecutor | None = None
+                           ) -> bytes:
+    """
+    Run the client side of a handshake, returning the session key. Raises
+    ValueError if the server replies for another curve, or if its key
+    confirmation does not match.
+    """
+    loop = asyncio.get_running_loop()
+    curve_id = CURVE_IDS[curve_name]
+    private_key, client_public = await loop.run_in_executor(
+        executor, generate_key_pair, curve_name)
+    client_hello = client_public + os.urandom(16)
+    writer.write(frame(curve_id, client_hello))
+    await writer.drain()
+
+    server_curve_id, server_hello = await read_frame(reader)
+    if server_curve_id != curve_id:
+        raise ValueError('Server replied for another curve.')
+    server_public = server_hello[:-48]
+    server_nonce = server_hello[-48:-32]
+    confirmation = server_hello[-32:]
+    session_key = await loop.run_in_executor(
+        executor, derive_session_key, curve_name, private_key,
+        server_public, client_hello[-16:] + server_nonce)
+
+    transcript = (bytes([curve_id]) + client_hello + server_public
+                  + server_nonce)
+    if not hmac.compare_digest(confirmation,
+                               key_confirmation(session_key, transcript)):
+        raise ValueError('Server key confirmation failed.')
+    return session_key
+
+
+async def connect_and_handshake(host: str, port: int, curve_name: str,
+                                executor: ThreadPoolExecutor) -> bytes:
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        return await handshake_client(reader, writer, curve_name, executor)
+    finally:
+        writer.close()
+        with contextlib.suppress(ConnectionError):
+            await writer.wait_closed()
+
+
+async def run_handshake_load(curve_name: str, concurrency: int,
+                             handshakes: int) -> dict[str, float]:
+    """
+    Run handshakes against a local server with at most concurrency of them
+    in flight, returning handshakes per second and p50 and p99 latency.
+    """
+    if handshakes < 1:
+        raise ValueError('At least one handshake is needed.')
+    executor = ThreadPoolExecutor()
+    server_keys = set()
+    server = HandshakeServer(executor, on_session=server_keys.add)
+    listener = await server.start()
+    host, port = listener.sockets[0].getsockname()[:2]
+
+    latencies = []
+    client_keys = set()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_handshake() -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            client_keys.add(await connect_and_handshake(
+                host, port, curve_name, executor))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_handshake() for _ in range(handshakes)))
+    elapsed = time.perf_counter() - start
+
+    listener.close()
+    await listener.wait_closed()
+    executor.shutdown()
+    assert client_keys <= server_keys
+
+    # quantiles needs two points, a single latency is every percentile.
+    percentiles = (statistics.quantiles(latencies, n=100)
+                   if len(latencies) > 1 else latencies * 99)
+    return {'handshakes_per_second': handshakes / elapsed,
+            'p50': percentiles[49], 'p99': percentiles[98]}
+
+
+def benchmark_handshakes(concurrency_levels: tuple[int, ...] = (1, 10, 100),
+                         handshakes: int = 1000) -> dict:
+    results = {}
+    for curve_name in CURVE_IDS:
+        for concurrency in concurrency_levels:
+            result = asyncio.run(run_handshake_load(curve_name, concurrency,
+                                                    handshakes))
+            results[curve_name, concurrency] = result
+            print(f'{curve_name:<10} concurrency {concurrency:4d}: '
+                  f'{result["handshakes_per_second"]:8.0f} handshakes/s, '
+                  f'p50 {result["p50"] * 1000:7.2f} ms, '
+                  f'p99 {result["p99"] * 1000:7.2f} ms')
+    return results
+
+
+if __name__ == '__main__':
+    benchmark_prime_generation()
+    benchmark_handshakes()
@@ -1,29 +1,34 @@
+import os
+import time
 import binascii
+import functools
+from collections.abc import Iterable
+
 from Crypto.Cipher import DES, DES3
 from Crypto.Util.Padding import pad, unpad
 
+from modern_cryptography.cipher_context import CBCContext
+
 
 def des_encrypt(data: str, key: bytes) -> [bytes, str]:
     """
-    Create a cipher object with cipher block chaining.
+    Look up the cipher context for the key, holding the checked key.
     Add padding so that the plaintext is a multiple of the block size.
-    Encrypt with an implicit initialisation vector (iv).
+    Encrypt with cipher block chaining and a random initialisation vector (iv).
     Join the iv with the encrypted message to form the ciphertext
     """
 
     if len(key) != 8:
         return 'Error : Key must be 8 bytes long.'
 
-    cipher = DES.new(key, DES.MODE_CBC)
-    padded_message = pad(data.encode(), DES.block_size)
-    encrypted_message = cipher.encrypt(padded_message)
-    return binascii.hexlify(cipher.iv + encrypted_message)
+    return binascii.hexlify(des_context(key).encrypt(data.encode()))
 
 
 def des_decrypt(encrypted_data: bytes, key: bytes) -> [str]:
     """
     Separate the iv from the actual ciphertext.
-    Decrypt the ciphertext with the cipher object.
+    Decrypt the ciphertext with the cipher context, reusing its key
+    schedule for short messages.
     Un-pad having used PKCS7 padding.
     """
 
@@ -31,11 +36,7 @@ def des_decrypt(encrypted_data: bytes, key: bytes) -> [str]:
         return 'Error : Key must be 8 bytes long.'
 
     encrypted_data = binascii.unhexlify(encrypted_data)
-    iv = encrypted_data[:DES.block_size]
-    cipher_text = encrypted_data[DES.block_size:]
-    cipher = DES.new(key, DES.MODE_CBC, iv)
-    decrypted_data = unpad(cipher.decrypt(cipher_text), DES.block_size)
-    return decrypted_data.decode()
+    return des_context(key).decrypt(encrypted_data).decode()
 
 
 def triple_des_encrypt(data: str, key: bytes) -> [bytes, str]:
@@ -43,10 +44,7 @@ def triple_des_encrypt(data: str, key: bytes) -> [bytes, str]:
     if len(key) not in (16, 24):
         return 'Error : Key must be 16 or 24 bytes long.'
 
-    cipher = DES3.new(key, DES3.MODE_CBC)
-    padded_data = pad(data.encode(), DES3.block_size)
-    encrypted_data = cipher.encrypt(padded_data)
-    return binascii.hexlify(cipher.iv + encrypted_data)
+    return binascii.hexlify(triple_des_context(key).encrypt(data.encode()))
 
 
 def triple_des_decrypt(encrypted_data: bytes, key: bytes) -> [str]:
@@ -55,8 +53,95 @@ def triple_des_decrypt(encrypted_data: bytes, key: bytes) -> [str]:
         return 'Error : Key must be 16 or 24 bytes long.'
 
     encrypted_data = binascii.unhexlify(encrypted_data)
-    iv = encrypted_data[:DES3.block_size]
-    cipher_text = encrypted_data[DES3.block_size:]
-    cipher = DES3.new(key, DES3.MODE_CBC, iv)
-    decrypted_data = unpad(cipher.decrypt(cipher_text), DES3.block_size)
-    return decrypted_data.decode()
+    return triple_des_context(key).decrypt(encrypted_data).decode()
+
+
+# Number of keyed contexts kept, least recently used keys are evicted first.
+CIPHER_CONTEXT_CACHE_SIZE = 64
+
+
+def des_context(key: bytes | bytearray) -> CBCContext:
+    # Bytearray keys are not hashable, they are cached by their bytes.
+    return cached_des_context(bytes(key))
+
+
+def triple_des_context(key: bytes | bytearray) -> CBCContext:
+    return cached_triple_des_context(bytes(key))
+
+
+@functools.lru_cache(maxsize=CIPHER_CONTEXT_CACHE_SIZE)
+def cached_des_context(key: bytes) -> CBCContext:
+    if len(key) != 8:
+        raise ValueError('Key must be 8 bytes long.')
+    return CBCContext(DES, key)
+
+
+@functools.lru_cache(maxsize=CIPHER_CONTEXT_CACHE_SIZE)
+def cached_triple_des_context(key: bytes) -> CBCContext:
+    if len(key) not in (16, 24):
+        raise ValueError('Key must be 16 or 24 bytes long.')
+    return CBCContext(DES3, key)
+
+
+def des_encrypt_many(records: Iterable[bytes], key: bytes) -> list[bytes]:
+    # Raw IV + ciphertext for each record, raising ValueError on a bad key.
+    context = des_context(key)
+    return [context.encrypt(record) for record in records]
+
+
+def des_decrypt_many(records: Iterable[bytes], key: bytes) -> list[bytes]:
+    context = des_context(key)
+    return [context.decrypt(record) for record in records]
+
+
+def triple_des_encrypt_many(records: Iterable[bytes],
+                            key: bytes) -> list[bytes]:
+    context = triple_des_context(key)
+    return [context.encrypt(record) for record in records]
+
+
+def triple_des_decrypt_many(records: Iterable[bytes],
+                            key: bytes) -> list[bytes]:
+    context = triple_des_context(key)
+    return [context.decrypt(record) for record in records]
+
+
+def benchmark_cipher_contexts(records: int = 20_000,
+                              sizes: tuple[int, ...] = (64, 1024)
+                              ) -> dict[tuple[str, int], float]:
+    """
+    Encrypt and decrypt records of each size under one 3DES key, building a
+    cipher object per record as before, and with the cached context,
+    returning records per second for each.
+    """
+    key = DES3.adjust_key_parity(os.urandom(24))
+    results = {}
+    for size in sizes:
+        raw = [os.urandom(size) for _ in range(records)]
+
+        def per_record():
+            for record in raw:
+                cipher = DES3.new(key, DES3.MODE_CBC)
+                encrypted = cipher.iv + cipher.encrypt(pad(record,
+                                                           DES3.block_size))
+                cipher = DES3.new(key, DES3.MODE_CBC,
+                                  encrypted[:DES3.block_size])
+                unpad(cipher.decrypt(encrypted[DES3.block_size:]),
+                      DES3.block_size)
+
+        def cached_context():
+            assert triple_des_decrypt_many(
+                triple_des_encrypt_many(raw, key), key) == raw
+
+        for name, function in [('cipher object per record', per_record),
+                               ('triple_des_encrypt_many', cached_context)]:
+            start = time.perf_counter()
+            function()
+            results[name, size] = records / (time.perf_counter() - start)
+            print(f'{name:<26} {size:6d} B '
+                  f'{results[name, size]:12,.0f} records/s')
+    return results
+
+
+if __name__ == '__main__':
+    benchmark_cipher_contexts()
@@ -1,34 +1,47 @@
 import os
+import json
+import time
+import queue
+import functools
+import itertools
+import struct
+import shutil
 import binascii
+import tempfile
+import threading
+import tracemalloc
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO
 
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad, unpad
 
+from modern_cryptography import doubling_counts, load_module
+from modern_cryptography.cipher_context import CBCContext
+
 
 def aes_encrypt(data: str, key: bytes) -> [bytes, str]:
     """
     Create a random initialization vector.
-    Create a cipher object with cipher block chaining.
+    Look up the cipher context for the key, holding the checked key.
     PKCS7 padded plaintext = a multiple of block size.
-    Call cipher object to encrypt.
+    Encrypt with cipher block chaining.
     Return the IV + encrypted data in hexadecimal.
     """
 
     if len(key) not in (16, 24, 32):
         return 'Error : Key must be 16, 24, or 32 bytes long.'
 
-    iv = os.urandom(AES.block_size)
-    cipher = AES.new(key, AES.MODE_CBC, iv)
-    padded_data = pad(data.encode(), AES.block_size)
-    encrypted_data = cipher.encrypt(padded_data)
-    return binascii.hexlify(iv + encrypted_data)
+    return binascii.hexlify(aes_context(key).encrypt(data.encode()))
 
 
 def aes_decrypt(encrypted_data: bytes, key: bytes) -> [str]:
     """
     Hex decoding.
     Separate the IV and the actual encrypted ciphertext.
-    Decrypt the ciphertext calling the cipher object.
+    Decrypt the ciphertext with the cipher context for the key, reusing
+    its key schedule for short messages.
     Un-pad from PKCS7 padding.
     """
 
@@ -36,9 +49,703 @@ def aes_decrypt(encrypted_data: bytes, key: bytes) -> [str]:
         return 'Error : Key must be 16, 24, or 32 bytes long.'
 
     encrypted_data = binascii.unhexlify(encrypted_data)
-    iv = encrypted_data[:AES.block_size]
-    ciphertext = encrypted_data[AES.block_size:]
-    cipher = AES.new(key, AES.MODE_CBC, iv)
-    padded_plaintext = cipher.decrypt(ciphertext)
-    plaintext = unpad(padded_plaintext, AES.block_size)
-    return plaintext.decode()
+    return aes_context(key).decrypt(encrypted_data).decode()
+
+
+# Number of keyed contexts kept, least recently used keys are evicted first.
+CIPHER_CONTEXT_CACHE_SIZE = 64
+
+
+def aes_context(key: bytes | bytearray) -> CBCContext:
+    # Bytearray keys are not hashable, they are cached by their bytes.
+    return cached_aes_context(bytes(key))
+
+
+@functools.lru_cache(maxsize=CIPHER_CONTEXT_CACHE_SIZE)
+def cached_aes_context(key: bytes) -> CBCContext:
+    if len(key) not in (16, 24, 32):
+        raise ValueError('Key must be 16, 24, or 32 bytes long.')
+    return CBCContext(AES, key)
+
+
+def aes_encrypt_many(records: Iterable[bytes], key: bytes) -> list[bytes]:
+    # Raw IV + ciphertext for each record, raising ValueError on a bad key.
+    context = aes_context(key)
+    return [context.encrypt(record) for record in records]
+
+
+def aes_decrypt_many(records: Iterable[bytes], key: bytes) -> list[bytes]:
+    context = aes_context(key)
+    return [context.decrypt(record) for record in records]
+
+
+def benchmark_cipher_contexts(records: int = 100_000,
+                              sizes: tuple[int, ...] = (64, 1024)
+                              ) -> dict[tuple[str, int], float]:
+    """
+    Encrypt and decrypt records of each size with aes_encrypt and
+    aes_decrypt as they were, and with the cached context, returning records
+    per second for each. 1 KiB is a typical size for rows and messages.
+    """
+    key = os.urandom(16)
+    results = {}
+    for size in sizes:
+        data = [os.urandom(size // 2).hex() for _ in range(records)]
+        raw = [record.encode() for record in data]
+
+        def per_record():
+            for record in data:
+                iv = os.urandom(AES.block_size)
+                cipher = AES.new(key, AES.MODE_CBC, iv)
+                encrypted = iv + cipher.encrypt(pad(record.encode(),
+                                                    AES.block_size))
+                cipher = AES.new(key, AES.MODE_CBC,
+                                 encrypted[:AES.block_size])
+                unpad(cipher.decrypt(encrypted[AES.block_size:]),
+                      AES.block_size).decode()
+
+        def cached_context():
+            assert aes_decrypt_many(aes_encrypt_many(raw, key), key) == raw
+
+        for name, function in [('cipher object per record', per_record),
+                               ('aes_encrypt_many', cached_context)]:
+            start = time.perf_counter()
+            function()
+            results[name, size] = records / (time.perf_counter() - start)
+            print(f'{name:<26} {size:6d} B '
+                  f'{results[name, size]:12,.0f} records/s')
+    return results
+
+
+"""
+Large files are encrypted as a stream of fixed size chunks, read with
+readinto into one reused buffer and encrypted into a second one, so memory
+use does not depend on the file size. The output is raw bytes:
+
+    header      magic b'AESS', version, mode, chunk size
+    IV          an 8 byte base nonce for GCM, a 16 byte IV for CBC
+    chunks      GCM, each chunk's ciphertext followed by its 16 byte tag
+                CBC, one ciphertext, PKCS7 padded at the end
+
+Each GCM chunk has its own nonce, the base nonce, a 3 byte chunk counter and
+a final flag, so chunks cannot be reordered, and the stream cannot be cut
+short at a chunk boundary. Every chunk but the last is full, the last is
+shorter, possibly empty. The counter limits a GCM stream to 2^24 chunks, 1 TiB
+with the default chunk size, longer streams need larger chunks.
+"""
+
+stream_header = struct.Struct('>4sBBI')
+STREAM_MAGIC = b'AESS'
+STREAM_MODES = {'gcm': 1, 'cbc': 2}
+TAG_SIZE = 16
+MAX_GCM_CHUNKS = 1 << 24
+
+
+class IterableReader:
+    # Presents an iterable of byte strings with the readinto of a file.
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._pending = memoryview(b'')
+
+    def readinto(self, buffer: bytearray | memoryview) -> int:
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = memoryview(chunk).cast('B')
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def read_full(source, buffer: memoryview) -> int:
+    # Fill the buffer, unless the source ends first, returning bytes read.
+    total = 0
+    while total < len(buffer):
+        size = source.readinto(buffer[total:])
+        if not size:
+            break
+        total += size
+    return total
+
+
+def gcm_nonce(base_nonce: bytes, counter: int, final: bool) -> bytes:
+    if counter >= MAX_GCM_CHUNKS:
+        raise ValueError(f'A GCM stream holds at most {MAX_GCM_CHUNKS} '
+                         f'chunks, use a larger chunk size.')
+    return base_nonce + counter.to_bytes(3, 'big') + bytes([final])
+
+
+def aes_encrypt_stream(source: BinaryIO | Iterable[bytes], sink: BinaryIO,
+                       key: bytes, mode: str = 'gcm',
+                       chunk_size: int = 1 << 16,
+                       base_nonce: bytes | None = None) -> int:
+    """
+    Encrypt a file object or an iterable of bytes into the framed format,
+    written to sink. Returns the number of plaintext bytes encrypted. Raises
+    ValueError once a GCM stream would exceed MAX_GCM_CHUNKS chunks.
+
+    The GCM base nonce is random unless given, a caller encrypting many
+    streams under one key may pass a counter instead.
+    """
+    if len(key) not in (16, 24, 32):
+        raise ValueError('Key must be 16, 24, or 32 bytes long.')
+    if mode not in STREAM_MODES:
+        raise ValueError("Mode must be 'gcm' or 'cbc'.")
+    if chunk_size % AES.block_size or not 0 < chunk_size < 1 << 32:
+        raise ValueError('Chunk size must be a multiple of 16 bytes.')
+    if base_nonce is not None and (mode != 'gcm' or len(base_nonce) != 8):
+        raise ValueError('A base nonce is 8 bytes, for GCM only.')
+    if not hasattr(source, 'readinto'):
+        source = IterableReader(source)
+
+    sink.write(stream_header.pack(STREAM_MAGIC, 1, STREAM_MODES[mode],
+                                  chunk_size))
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    output = memoryview(bytearray(chunk_size + AES.block_size))
+    total = 0
+
+    if mode == 'cbc':
+        iv = os.urandom(AES.block_size)
+        sink.write(iv)
+        cipher = AES.new(key, AES.MODE_CBC, iv)
+        while True:
+            size = read_full(source, view)
+            total += size
+            if size < chunk_size:
+                break
+            cipher.encrypt(view, output=output[:size])
+            sink.write(output[:size])
+        padded = pad(bytes(view[:size]), AES.block_size)
+        sink.write(cipher.encrypt(padded))
+        return total
+
+    base_nonce = base_nonce or os.urandom(8)
+    sink.write(base_nonce)
+    counter = 0
+    while True:
+        size = read_full(source, view)
+        total += size
+        final = size < chunk_size
+        cipher = AES.new(key, AES.MODE_GCM,
+                         nonce=gcm_nonce(base_nonce, counter, final))
+        cipher.encrypt(view[:size], output=output[:size])
+        sink.write(output[:size])
+        sink.write(cipher.digest())
+        if final:
+            return total
+        counter += 1
+
+
+def aes_decrypt_stream(source: BinaryIO, sink: BinaryIO, key: bytes) -> int:
+    """
+    Decrypt the framed format from source into sink, returning the number of
+    plaintext bytes. Raises ValueError if the stream is malformed, modified
+    or truncated, GCM chunks are only written once their tag is verified.
+    """
+    if len(key) not in (16, 24, 32):
+        raise ValueError('Key must be 16, 24, or 32 bytes long.')
+
+    header = source.read(stream_header.size)
+    if len(header) < stream_header.size:
+        raise ValueError('Stream is truncated.')
+    magic, version, mode, chunk_size = stream_header.unpack(header)
+    if magic != STREAM_MAGIC or version != 1 or \
+            mode not in STREAM_MODES.values():
+        raise ValueError('Not an AES stream.')
+
+    buffer = bytearray(chunk_size + TAG_SIZE)
+    view = memoryview(buffer)
+    output = memoryview(bytearray(chunk_size + TAG_SIZE))
+    total = 0
+
+    if mode == STREAM_MODES['cbc']:
+        iv = source.read(AES.block_size)
+        if len(iv) < AES.block_size:
+            raise ValueError('Stream is truncated.')
+        cipher = AES.new(key, AES.MODE_CBC, iv)
+        # The last block is held back, to be unpadded once the stream ends.
+        held = b''
+        while True:
+            size = read_full(source, view[:chunk_size])
+            if size % AES.block_size:
+                raise ValueError('Stream is truncated.')
+            if not size:
+                break
+            cipher.decrypt(view[:size], output=output[:size])
+            sink.write(held)
+            sink.write(output[:size - AES.block_size])
+            total += len(held) + size - AES.block_size
+            held = bytes(output[size - AES.block_size:size])
+        if not held:
+            raise ValueError('Stream is truncated.')
+        plaintext = unpad(held, AES.block_size)
+        sink.write(plaintext)
+        return total + len(plaintext)
+
+    base_nonce = source.read(8)
+    if len(base_nonce) < 8:
+        raise ValueError('Stream is truncated.')
+    counter = 0
+    while True:
+        size = read_full(source, view)
+        if size < TAG_SIZE:
+            raise ValueError('Stream is truncated.')
+        final = size < chunk_size + TAG_SIZE
+        cipher = AES.new(key, AES.MODE_GCM,
+                         nonce=gcm_nonce(base_nonce, counter, final))
+        length = size - TAG_SIZE
+        cipher.decrypt_and_verify(view[:length], view[length:size],
+                                  output=output[:length])
+        sink.write(output[:length])
+        total += length
+        if final:
+            if source.read(1):
+                raise ValueError('Data after the final chunk.')
+            return total
+        counter += 1
+
+
+def aes_encrypt_file(in_path: str, out_path: str, key: bytes,
+                     **options) -> int:
+    with open(in_path, 'rb') as source, open(out_path, 'wb') as sink:
+        return aes_encrypt_stream(source, sink, key, **options)
+
+
+def aes_decrypt_file(in_path: str, out_path: str, key: bytes) -> int:
+    with open(in_path, 'rb') as source, open(out_path, 'wb') as sink:
+        return aes_decrypt_stream(source, sink, key)
+
+
+def benchmark_aes_stream(size: int = 1 << 25) -> dict[str, dict[str, float]]:
+    """
+    Encrypt and decrypt size bytes with aes_encrypt and aes_decrypt, and as a
+    file with the streaming functions in GCM and CBC mode, reporting MB/s and
+    the peak memory allocated, as traced by tracemalloc.
+    """
+    key = os.urandom(32)
+    directory = tempfile.mkdtemp()
+    plain_path = os.path.join(directory, 'plain')
+    cipher_path = os.path.join(directory, 'cipher')
+    with open(plain_path, 'wb') as file:
+        for _ in range(size // (1 << 20)):
+            file.write(os.urandom(1 << 20).hex()[:1 << 20].encode())
+
+    def measure(function) -> tuple[float, float]:
+        tracemalloc.start()
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return size / elapsed / 1e6, peak / 1e6
+
+    def whole_string():
+        with open(plain_path) as file:
+            data = file.read()
+        assert aes_decrypt(aes_encrypt(data, key), key) == data
+
+    def streaming(mode: str):
+        def run():
+            aes_encrypt_file(plain_path, cipher_path, key, mode=mode)
+            with open(cipher_path, 'rb') as source, \
+                    open(os.devnull, 'wb') as sink:
+                aes_decrypt_stream(source, sink, key)
+        return run
+
+    results = {}
+    try:
+        for name, function in [('aes_encrypt/aes_decrypt', whole_string),
+                               ('stream gcm', streaming('gcm')),
+                               ('stream cbc', streaming('cbc'))]:
+            rate, peak = measure(function)
+            results[name] = {'mb_per_second': rate, 'peak_mb': peak}
+            print(f'{name:<24} {rate:8.1f} MB/s   peak {peak:8.2f} MB')
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+"""
+CBC encryption is sequential, each block depends on the one before. For
+large buffers the input is instead split into fixed size segments, each
+encrypted with AES-GCM under its own nonce, the base nonce followed by the
+segment index. Segments are independent, so they are encrypted on a thread
+pool, pycryptodome releases the GIL while it encrypts. Each thread reads a
+memoryview of the input and writes into its slice of one preallocated
+output buffer, so nothing is copied.
+
+Segment i starts at a fixed offset, so a single segment can be decrypted on
+its own. The header, holding the total length, is authenticated with every
+segment, so segments cannot be moved between files or cut off the end.
+
+    header      magic b'AESP', version, segment size, length, base nonce
+    segments    each segment's ciphertext followed by its 16 byte tag
+"""
+
+parallel_header = struct.Struct('>4sBIQ8s')
+PARALLEL_MAGIC = b'AESP'
+
+
+def segment_count(length: int, segment_size: int) -> int:
+    # An empty input still has one, empty, segment carrying a tag.
+    return max(1, -(-length // segment_size))
+
+
+def aes_encrypt_parallel(data: bytes | bytearray | memoryview, key: bytes,
+                         segment_size: int = 1 << 20,
+                         workers: int | None = None,
+                         base_nonce: bytes | None = None) -> bytearray:
+    # The base nonce is random unless given, as in aes_encrypt_stream.
+    if len(key) not in (16, 24, 32):
+        raise ValueError('Key must be 16, 24, or 32 bytes long.')
+    if not 0 < segment_size < 1 << 32:
+        raise ValueError('Segment size must be from 1 byte to 4 GiB - 1.')
+    if base_nonce is not None and len(base_nonce) != 8:
+        raise ValueError('A base nonce is 8 bytes.')
+
+    source = memoryview(data).cast('B')
+    length = len(source)
+    count = segment_count(length, segment_size)
+    if count > 1 << 32:
+        raise ValueError('Too many segments, use a larger segment size.')
+    header = parallel_header.pack(PARALLEL_MAGIC, 1, segment_size, length,
+                                  base_nonce or os.urandom(8))
+    output = bytearray(len(header) + length + count * TAG_SIZE)
+    output[:len(header)] = header
+    view = memoryview(output)
+    base_nonce = header[-8:]
+
+    def encrypt_segment(index: int) -> None:
+        start = index * segment_size
+        end = min(start + segment_size, length)
+        offset = len(header) + index * (segment_size + TAG_SIZE)
+        cipher = AES.new(key, AES.MODE_GCM,
+                         nonce=base_nonce + index.to_bytes(4, 'big'))
+        cipher.update(header)
+        cipher.encrypt(source[start:end],
+                       output=view[offset:offset + end - start])
+        view[offset + end - start:offset + end - start + TAG_SIZE] = \
+            cipher.digest()
+
+    with ThreadPoolExecutor(workers) as executor:
+        list(executor.map(encrypt_segment, range(count)))
+    return output
+
+
+def read_parallel_header(blob: memoryview) -> tuple[bytes, int, int, int]:
+    # Returns the header, the segment size, the length and segment count.
+    if len(blob) < parallel_header.size:
+        raise ValueError('Ciphertext is truncated.')
+    header = bytes(blob[:parallel_header.size])
+    magic, version, segment_size, length, _ = parallel_header.unpack(header)
+    if magic != PARALLEL_MAGIC or version != 1 or not segment_size:
+        raise ValueError('Not a parallel AES ciphertext.')
+    count = segment_count(length, segment_size)
+    if len(blob) != len(header) + length + count * TAG_SIZE:
+        raise ValueError('Ciphertext has the wrong length.')
+    return header, segment_size, length, count
+
+
+def decrypt_segment_into(blob: memoryview, key: bytes, header: bytes,
+                         segment_size: int, length: int, index: int,
+                         output: memoryview) -> None:
+    start = index * segment_size
+    end = min(start + segment_size, length)
+    offset = len(header) + index * (segment_size + TAG_SIZE)
+    cipher = AES.new(key, AES.MODE_GCM,
+                     nonce=header[-8:] + index.to_bytes(4, 'big'))
+    cipher.update(header)
+    cipher.decrypt_and_verify(
+        blob[offset:offset + end - start],
+        blob[offset + end - start:offset + end - start + TAG_SIZE],
+        output=output)
+
+
+def aes_decrypt_parallel(blob: bytes | bytearray | memoryview, key: bytes,
+                         workers: int | None = None) -> bytearray:
+    """
+    Decrypt every segment on a thread pool, into one preallocated buffer.
+    Raises ValueError if any segment fails to verify.
+    """
+    if len(key) not in (16, 24, 32):
+        raise ValueError('Key must be 16, 24, or 32 bytes long.')
+
+    blob = memoryview(blob).cast('B')
+    header, segment_size, length, count = read_parallel_header(blob)
+    output = bytearray(length)
+    view = memoryview(output)
+
+    def decrypt(index: int) -> None:
+        start = index * segment_size
+        decrypt_segment_into(blob, key, header, segment_size, length, index,
+                             view[start:start + segment_size])
+
+    with ThreadPoolExecutor(workers) as executor:
+        list(executor.map(decrypt, range(count)))
+    return output
+
+
+def aes_decrypt_segment(blob: bytes | bytearray | memoryview, key: bytes,
+                        index: int) -> bytes:
+    # Random access, decrypt and verify segment index alone.
+    blob = memoryview(blob).cast('B')
+    header, segment_size, length, count = read_parallel_header(blob)
+    if not 0 <= index < count:
+        raise IndexError('Segment index out of range.')
+    output = bytearray(min(segment_size, length - index * segment_size))
+    decrypt_segment_into(blob, key, header, segment_size, length, index,
+                         memoryview(output))
+    return bytes(output)
+
+
+def benchmark_aes_parallel(size: int = 1 << 28,
+                           max_workers: int | None = None
+                           ) -> dict[int, dict[str, float]]:
+    """
+    Encrypt and decrypt size bytes with 1 up to max_workers threads,
+    doubling each time, reporting MB/s for each.
+    """
+    key = os.urandom(32)
+    data = bytearray(size)
+    results = {}
+    for workers in doubling_counts(max_workers):
+        start = time.perf_counter()
+        blob = aes_encrypt_parallel(data, key, workers=workers)
+        middle = time.perf_counter()
+        assert aes_decrypt_parallel(blob, key, workers=workers) == data
+        end = time.perf_counter()
+        results[workers] = {'encrypt': size / (middle - start) / 1e6,
+                            'decrypt': size / (end - middle) / 1e6}
+        print(f'{workers:3d} threads: encrypt '
+              f'{results[workers]["encrypt"]:8.1f} MB/s, decrypt '
+              f'{results[workers]["decrypt"]:8.1f} MB/s')
+    return results
+
+
+"""
+Records encrypted with triple_des_encrypt, one hex IV + ciphertext per line,
+may be moved to AES in bulk. Each file is read in batches of lines, which
+pass through four stages joined by bounded queues, so a slow stage holds the
+others back instead of letting batches pile up in memory:
+
+    read  ->  3DES decrypt  ->  AES encrypt  ->  write
+
+The decrypt and encrypt stages run on worker threads. Each record is
+chained by a CBC cipher object in C, which releases the GIL, so the stages
+overlap. Plaintext only exists in memory between the two. Output files hold
+one aes_encrypt style hex record per line, at the same relative path as
+their input.
+
+The writer puts batches back in order, and after each batch appends the
+number of records and output bytes of its file to a checkpoint journal, one
+JSON line per batch. A restarted migration replays the journal, truncates
+each output to its last entry and skips the records already written. The
+journal is compacted to one line per file when a migration starts.
+"""
+
+
+def load_checkpoint(path: str | None) -> dict[str, list[int]]:
+    # The last entry of each file wins, a line cut short by a crash is
+    # ignored.
+    checkpoint = {}
+    if path is None or not os.path.exists(path):
+        return checkpoint
+    with open(path, 'rb') as file:
+        for line in file:
+            if not line.endswith(b'\n'):
+                break
+            relative, done, size = json.loads(line)
+            checkpoint[relative] = [done, size]
+    return checkpoint
+
+
+def open_checkpoint_journal(path: str | None,
+                            checkpoint: dict[str, list[int]]):
+    # Compacted through a temporary file, so a crash leaves the old journal.
+    if path is None:
+        return None
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'w') as file:
+        for relative, (done, size) in checkpoint.items():
+            file.write(json.dumps([relative, done, size]) + '\n')
+    os.replace(path + '.tmp', path)
+    return open(path, 'a')
+
+
+def migration_inputs(source: str) -> list[tuple[str, str]]:
+    # (path, relative path) of a single file, or every file in a directory.
+    if os.path.isfile(source):
+        return [(source, os.path.basename(source))]
+    inputs = []
+    for directory, _, files in os.walk(source):
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            inputs.append((path, os.path.relpath(path, source)))
+    return sorted(inputs, key=lambda item: item[1])
+
+
+def migrate_3des_to_aes(source: str, destination: str, des_key: bytes,
+                        aes_key: bytes, checkpoint_path: str | None = None,
+                        batch_size: int = 1000, workers: int = 4,
+                        queue_size: int = 8) -> dict[str, float]:
+    """
+    Re-encrypt every 3DES record under source, a file or a directory, with
+    AES into destination. Returns the records migrated, the time taken and
+    records per second. A failing record stops the migration and raises, the
+    checkpoint then holds the progress made so far.
+    """
+    des_context = load_module('06_des_and_triple_des').triple_des_context(
+        des_key)
+    context = aes_context(aes_key)
+    checkpoint = load_checkpoint(checkpoint_path)
+    journal = open_checkpoint_journal(checkpoint_path, checkpoint)
+
+    read_queue = queue.Queue(queue_size)
+    plain_queue = queue.Queue(queue_size)
+    write_queue = queue.Queue(queue_size)
+    stop = threading.Event()
+    errors = []
+
+    # Queue operations give up once the pipeline is stopping on an error,
+    # rather than block forever.
+    def put(target: queue.Queue, item) -> bool:
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(source_queue: queue.Queue):
+        while not stop.is_set():
+            try:
+                return source_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def read() -> None:
+        try:
+            for path, relative in migration_inputs(source):
+                done = checkpoint.get(relative, [0, 0])[0]
+                with open(path, 'rb') as file:
+                    lines = (line.strip() for line in file)
+                    records = itertools.islice(
+                        (line for line in lines if line), done, None)
+                    # Read one batch ahead, to mark the last batch of a file.
+                    batch = list(itertools.islice(records, batch_size))
+                    number = 0
+                    while True:
+                        next_batch = list(itertools.islice(records,
+                                                           batch_size))
+                        if not put(read_queue, (relative, number,
+                                                not next_batch, batch)):
+                            return
+                        if not next_batch:
+                            break
+                        batch = next_batch
+                        number += 1
+        except Exception as error:
+            errors.append(error)
+            stop.set()
+        finally:
+            for _ in range(workers):
+                put(read_queue, None)
+
+    def stage(source_queue: queue.Queue, target_queue: queue.Queue,
+              transform) -> None:
+        while True:
+            item = get(source_queue)
+            if item is None:
+                put(target_queue, None)
+                return
+            relative, number, last, batch = item
+            try:
+                batch = [transform(record) for record in batch]
+            except Exception as error:
+                errors.append(error)
+                stop.set()
+            put(target_queue, (relative, number, last, batch))
+
+    def decrypt(record: bytes) -> bytes:
+        return des_context.decrypt(binascii.unhexlify(record))
+
+    def encrypt(plaintext: bytes) -> bytes:
+        return binascii.hexlify(context.encrypt(plaintext))
+
+    threads = [threading.Thread(target=read)]
+    threads += [threading.Thread(target=stage,
+                                 args=(read_queue, plain_queue, decrypt))
+                for _ in range(workers)]
+    threads += [threading.Thread(target=stage,
+                                 args=(plain_queue, write_queue, encrypt))
+                for _ in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    migrated = 0
+    finished = 0
+    pending = {}
+    next_batch = {}
+    outputs = {}
+    try:
+        while finished < workers:
+            item = get(write_queue)
+            if item is None:
+                if stop.is_set():
+                    break
+                finished += 1
+                continue
+            relative, number, last, batch = item
+            pending[relative, number] = (last, batch)
+
+            # Write every batch of this file that is now next in order.
+            while (relative, next_batch.get(relative, 0)) in pending:
+                last, batch = pending.pop((relative,
+                                           next_batch.get(relative, 0)))
+                next_batch[relative] = next_batch.get(relative, 0) + 1
+                if relative not in outputs:
+                    path = os.path.join(destination, relative)
+                    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                    outputs[relative] = open(path, 'ab')
+                    outputs[relative].truncate(
+                        checkpoint.get(relative, [0, 0])[1])
+                output = outputs[relative]
+                output.write(b''.join(record + b'\n' for record in batch))
+                output.flush()
+                os.fsync(output.fileno())
+                done = checkpoint.get(relative, [0, 0])[0] + len(batch)
+                checkpoint[relative] = [done, output.tell()]
+                if journal is not None:
+                    journal.write(json.dumps([relative, done,
+                                              output.tell()]) + '\n')
+                    journal.flush()
+                    os.fsync(journal.fileno())
+                migrated += len(batch)
+                if last:
+                    outputs.pop(relative).close()
+    finally:
+        stop.set()
+        for output in outputs.values():
+            output.close()
+        for thread in threads:
+            thread.join()
+        if journal is not None:
+            journal.close()
+
+    if errors:
+        raise errors[0]
+    elapsed = time.perf_counter() - start
+    return {'records': migrated, 'seconds': elapsed,
+            'records_per_second': migrated / elapsed if elapsed else 0.0}
+
+
+if __name__ == '__main__':
+    benchmark_cipher_contexts()
+    benchmark_aes_stream()
+    benchmark_aes_parallel()
@@ -1,12 +1,36 @@
+import io
 import os
+import time
+import struct
 import hashlib
+import functools
+import threading
+from collections import OrderedDict
+from typing import BinaryIO
 
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
 
+from modern_cryptography import load_module
+from modern_cryptography.example_keys import (benchmark_import_time,
+                                              load_or_generate_key,
+                                              make_key_getattr)
 
-private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048,)
-public_key = private_key.public_key()
+
+"""
+The example key is generated on first use of private_key, public_key or the
+numbers p, q, n, e and d, not at import, as 2048 bit key generation takes
+hundreds of milliseconds. See modern_cryptography.example_keys for where it
+may be cached.
+"""
+
+
+@functools.cache
+def example_private_key() -> rsa.RSAPrivateKey:
+    return load_or_generate_key('rsa_cipher')
+
+
+__getattr__ = make_key_getattr(globals(), example_private_key)
 
 
 def rsa_encrypt(plaintext: str, key: rsa.RSAPublicKey) -> bytes:
@@ -24,19 +48,207 @@ def rsa_decrypt(ciphertext: bytes, key: rsa.RSAPrivateKey) -> str:
     return plaintext.decode()
 
 
+"""
+RSA-OAEP can only encrypt about 190 bytes with a 2048 bit key, and every
+decryption is a 2048 bit private key operation. Hybrid, or envelope,
+encryption uses RSA only to wrap a random 32 byte AES data key, and encrypts
+the payload itself with AES-GCM from 07_aes.py:
 
+    header      magic b'RSAE', version, length of the wrapped key
+    wrapped     the raw data key, encrypted with RSA-OAEP
+    payload     aes_encrypt_parallel output, or an aes_encrypt_stream frame
 
+A session reuses one data key, and so one wrapped key, for many messages. A
+receiver may cache unwrapped data keys by the digest of the wrapped key, so
+only the first message of a session needs the RSA private key operation.
+Each message of a session takes the next value of a counter as its 8 byte
+GCM base nonce, so no nonce repeats under a data key, and the session draws
+a new data key after max_messages messages.
+"""
 
-# Manual Implementation :
+envelope_header = struct.Struct('>4sBH')
+ENVELOPE_MAGIC = b'RSAE'
+ENVELOPE_VERSION = 2
+
+
+def oaep_padding() -> padding.OAEP:
+    return padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                        algorithm=hashes.SHA256(), label=None)
+
+
+class DataKeyCache:
+    """
+    Unwrapped data keys by the sha256 digest of their wrapped key. Keys are
+    dropped after ttl seconds, and the least recently used key is dropped
+    once there are more than maxsize.
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._keys: OrderedDict[bytes, tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest: bytes) -> bytes | None:
+        with self._lock:
+            entry = self._keys.get(digest)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl:
+                del self._keys[digest]
+                return None
+            self._keys.move_to_end(digest)
+            return entry[1]
+
+    def put(self, digest: bytes, data_key: bytes) -> None:
+        with self._lock:
+            self._keys[digest] = (time.monotonic(), data_key)
+            self._keys.move_to_end(digest)
+            while len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+
+
+class EnvelopeSession:
+    """
+    A random data key, wrapped once, for encrypting many messages. Messages
+    take their base nonces from a counter, and the data key is replaced
+    after max_messages messages. Sessions may be shared between threads.
+    """
+    def __init__(self, key: rsa.RSAPublicKey,
+                 max_messages: int = 1 << 24) -> None:
+        self.key = key
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+        self._rotate()
+
+    def _rotate(self) -> None:
+        self.data_key = os.urandom(32)
+        wrapped_key = self.key.encrypt(self.data_key, oaep_padding())
+        self.header = envelope_header.pack(
+            ENVELOPE_MAGIC, ENVELOPE_VERSION, len(wrapped_key)) + wrapped_key
+        self.messages = 0
+
+    def _next_message(self) -> tuple[bytes, bytes, bytes]:
+        # The header, data key and base nonce of the next message.
+        with self._lock:
+            if self.messages >= self.max_messages:
+                self._rotate()
+            base_nonce = self.messages.to_bytes(8, 'big')
+            self.messages += 1
+            return self.header, self.data_key, base_nonce
+
+    def encrypt(self, plaintext: bytes) -> bytes:
+        header, data_key, base_nonce = self._next_message()
+        aes = load_module('07_aes')
+        return header + aes.aes_encrypt_parallel(plaintext, data_key,
+                                                 base_nonce=base_nonce)
+
+    def encrypt_stream(self, source: BinaryIO, sink: BinaryIO,
+                       **options) -> int:
+        if options.pop('mode', 'gcm') != 'gcm':
+            raise ValueError('Envelopes are only streamed with GCM.')
+        header, data_key, base_nonce = self._next_message()
+        sink.write(header)
+        return load_module('07_aes').aes_encrypt_stream(
+            source, sink, data_key, mode='gcm', base_nonce=base_nonce,
+            **options)
+
+
+def unwrap_data_key(source: BinaryIO, key: rsa.RSAPrivateKey,
+                    cache: DataKeyCache | None = None) -> bytes:
+    # Read the header and wrapped key, returning the data key.
+    header = source.read(envelope_header.size)
+    if len(header) < envelope_header.size:
+        raise ValueError('Envelope is truncated.')
+    magic, version, length = envelope_header.unpack(header)
+    if magic != ENVELOPE_MAGIC or version != ENVELOPE_VERSION:
+        raise ValueError(f'Not a version {ENVELOPE_VERSION} envelope.')
+    wrapped_key = source.read(length)
+    if len(wrapped_key) < length:
+        raise ValueError('Envelope is truncated.')
+
+    digest = hashlib.sha256(wrapped_key).digest()
+    data_key = cache.get(digest) if cache is not None else None
+    if data_key is None:
+        data_key = key.decrypt(wrapped_key, oaep_padding())
+        if cache is not None:
+            cache.put(digest, data_key)
+    return data_key
+
+
+def envelope_encrypt(plaintext: bytes, key: rsa.RSAPublicKey) -> bytes:
+    return EnvelopeSession(key).encrypt(plaintext)
+
+
+def envelope_decrypt(envelope: bytes, key: rsa.RSAPrivateKey,
+                     cache: DataKeyCache | None = None) -> bytes:
+    source = io.BytesIO(envelope)
+    data_key = unwrap_data_key(source, key, cache)
+    payload = memoryview(envelope)[source.tell():]
+    return bytes(load_module('07_aes').aes_decrypt_parallel(payload,
+                                                            data_key))
+
+
+def envelope_encrypt_stream(source: BinaryIO, sink: BinaryIO,
+                            key: rsa.RSAPublicKey, **options) -> int:
+    return EnvelopeSession(key).encrypt_stream(source, sink, **options)
+
+
+def envelope_decrypt_stream(source: BinaryIO, sink: BinaryIO,
+                            key: rsa.RSAPrivateKey,
+                            cache: DataKeyCache | None = None) -> int:
+    data_key = unwrap_data_key(source, key, cache)
+    return load_module('07_aes').aes_decrypt_stream(source, sink, data_key)
+
+
+def benchmark_envelopes(count: int = 200,
+                        size: int = 1 << 26) -> dict[str, float]:
+    """
+    Messages per second for short messages, with RSA-OAEP alone, with a new
+    envelope per message, and with one session and a data key cache, then
+    MB/s for a large streamed payload.
+    """
+    private_key = example_private_key()
+    public_key = private_key.public_key()
+    message = 'short message'
+    cache = DataKeyCache()
+    session = EnvelopeSession(public_key)
+
+    candidates = {
+        'rsa_encrypt/rsa_decrypt':
+            lambda: rsa_decrypt(rsa_encrypt(message, public_key),
+                                private_key),
+        'envelope per message':
+            lambda: envelope_decrypt(envelope_encrypt(message.encode(),
+                                                      public_key),
+                                     private_key),
+        'session with key cache':
+            lambda: envelope_decrypt(session.encrypt(message.encode()),
+                                     private_key, cache),
+    }
 
-private_numbers = private_key.private_numbers()
-public_numbers = public_key.public_numbers()
+    results = {}
+    for name, function in candidates.items():
+        start = time.perf_counter()
+        for _ in range(count):
+            function()
+        results[name] = count / (time.perf_counter() - start)
+        print(f'{name:<26} {results[name]:10.1f} messages/s')
 
-p = private_numbers.p   # First prime
-q = private_numbers.q   # Second prime
-n = public_numbers.n    # Modulus = p*q
-e = public_numbers.e    # Public exponent
-d = private_numbers.d   # Private exponent = inv(e) mod n
+    payload = os.urandom(size)
+    sealed = io.BytesIO()
+    start = time.perf_counter()
+    envelope_encrypt_stream(io.BytesIO(payload), sealed, public_key,
+                            chunk_size=1 << 20)
+    opened = io.BytesIO()
+    envelope_decrypt_stream(io.BytesIO(sealed.getvalue()), opened,
+                            private_key)
+    results['stream MB/s'] = 2 * size / (time.perf_counter() - start) / 1e6
+    assert opened.getvalue() == payload
+    print(f'{"stream":<26} {results["stream MB/s"]:10.1f} MB/s')
+    return results
+
+
+# Manual Implementation :
 
 
 def mgf1(input_bytes: bytes, length: int) -> bytes:
@@ -44,22 +256,31 @@ def mgf1(input_bytes: bytes, length: int) -> bytes:
     Use a mask to randomise the plaintext, this strengthens the cipher
     against patterns in outputs and known plaintext attacks.
     Big-Endian storage is the cryptography standard.
-    Append hash(input + counter) to the output, until the desired length.
+    Write hash(input + counter) into a preallocated output, until the
+    desired length. The input is hashed once, each counter continues a copy.
     """
-    output = b""
-    counter = 0
-    while len(output) < length:
-        counter_bytes = counter.to_bytes(4, byteorder="big")
-        output += hashlib.sha256(input_bytes + counter_bytes).digest()
-        counter += 1
-    return output[:length]
+    hash_len = hashlib.sha256().digest_size
+    blocks = -(-length // hash_len)
+    output = bytearray(blocks * hash_len)
+    prefix = hashlib.sha256(input_bytes)
+    for counter in range(blocks):
+        block_hash = prefix.copy()
+        block_hash.update(counter.to_bytes(4, byteorder="big"))
+        output[counter * hash_len:(counter + 1) * hash_len] = \
+            block_hash.digest()
+    return bytes(output[:length])
+
+
+def xor_bytes(x: bytes, y: bytes) -> bytes:
+    # Xor whole buffers at once, as big integers.
+    return (int.from_bytes(x, "big") ^ int.from_bytes(y, "big")).to_bytes(
+        len(x), "big")
 
 
 def oaep_pad(data: bytes, lab: bytes = b"", modulus_size: int = 256) -> bytes:
     """
     Hash the label
-    Pad the message
-    Add length indicator
+    Pad the message with zeros, then a 0x01 byte marking its start
     SGenerate a random seed
     Mask the padded message (db) and seed
     Combine masked_seed and masked_db
@@ -73,18 +294,121 @@ def oaep_pad(data: bytes, lab: bytes = b"", modulus_size: int = 256) -> bytes:
 
     l_hash = hash_function(lab).digest()
     padding_zeros = b"\x00" * (max_message_length - len(data))
-    padded_message = data + padding_zeros
-    db = l_hash + b"\x00" + padded_message
+    db = l_hash + padding_zeros + b"\x01" + data
     seed = os.urandom(hash_len)
     db_mask = mgf1(seed, len(db))
-    masked_db = bytes(x ^ y for x, y in zip(db, db_mask))
+    masked_db = xor_bytes(db, db_mask)
     seed_mask = mgf1(masked_db, len(seed))
-    masked_seed = bytes(x ^ y for x, y in zip(seed, seed_mask))
+    masked_seed = xor_bytes(seed, seed_mask)
     return b"\x00" + masked_seed + masked_db
 
 
-test_message = b"hello"
-test_label = b"label"
-test_modulus_size = 256  # 2048-bit key (256 bytes)
-padded_message_example = oaep_pad(test_message, test_label, test_modulus_size)
-print("OAEP Padded Message:", padded_message_example.hex())
+def oaep_unpad(padded: bytes, lab: bytes = b"",
+               modulus_size: int = 256) -> bytes:
+    """
+    Split into the leading zero, masked_seed and masked_db
+    Unmask the seed, then the db
+    Check the label hash, and find the 0x01 byte after the zero padding
+    Every failure raises the same error, so as not to tell an attacker
+    which check failed.
+    """
+    hash_function = hashlib.sha256
+    hash_len = hash_function().digest_size
+    if len(padded) != modulus_size or modulus_size < 2 * hash_len + 2:
+        raise ValueError("Decryption error.")
+
+    masked_seed = padded[1:hash_len + 1]
+    masked_db = padded[hash_len + 1:]
+    seed = xor_bytes(masked_seed, mgf1(masked_db, hash_len))
+    db = xor_bytes(masked_db, mgf1(seed, len(masked_db)))
+
+    l_hash = hash_function(lab).digest()
+    separator = db.find(b"\x01", hash_len)
+    if padded[0] != 0 or db[:hash_len] != l_hash or separator < 0 or \
+            db[hash_len:separator].strip(b"\x00"):
+        raise ValueError("Decryption error.")
+    return db[separator + 1:]
+
+
+@functools.lru_cache(maxsize=16)
+def crt_parameters(p: int, q: int, d: int) -> tuple[int, int, int]:
+    # dp = d mod (p - 1), dq = d mod (q - 1) and qinv = inv(q) mod p.
+    return d % (p - 1), d % (q - 1), pow(q, -1, p)
+
+
+def rsa_encrypt_manual(message: bytes, e: int, n: int,
+                       lab: bytes = b"") -> bytes:
+    """
+    OAEP pad the message to the byte length of n, then raise it to e mod n.
+    """
+    modulus_size = (n.bit_length() + 7) // 8
+    padded = oaep_pad(message, lab, modulus_size)
+    ciphertext = pow(int.from_bytes(padded, "big"), e, n)
+    return ciphertext.to_bytes(modulus_size, "big")
+
+
+def rsa_decrypt_manual(ciphertext: bytes, p: int, q: int, d: int,
+                       lab: bytes = b"") -> bytes:
+    """
+    Raise the ciphertext to d with the Chinese remainder theorem, as
+    c^dp mod p and c^dq mod q, recombined with qinv, then OAEP unpad.
+    """
+    n = p * q
+    modulus_size = (n.bit_length() + 7) // 8
+    c = int.from_bytes(ciphertext, "big")
+    if len(ciphertext) != modulus_size or c >= n:
+        raise ValueError("Decryption error.")
+
+    dp, dq, qinv = crt_parameters(p, q, d)
+    m1 = pow(c, dp, p)
+    m2 = pow(c, dq, q)
+    h = qinv * (m1 - m2) % p
+    padded = (m2 + h * q).to_bytes(modulus_size, "big")
+    return oaep_unpad(padded, lab, modulus_size)
+
+
+def benchmark_rsa_oaep(count: int = 200) -> dict[str, float]:
+    """
+    Encrypt and decrypt count messages with the manual functions and with
+    rsa_encrypt and rsa_decrypt, returning operations per second.
+    """
+    private_key = example_private_key()
+    public_key = private_key.public_key()
+    numbers = private_key.private_numbers()
+    p, q, d = numbers.p, numbers.q, numbers.d
+    e, n = numbers.public_numbers.e, numbers.public_numbers.n
+
+    message = "benchmark message"
+    candidates = {
+        'rsa_encrypt_manual':
+            lambda: rsa_encrypt_manual(message.encode(), e, n),
+        'rsa_encrypt': lambda: rsa_encrypt(message, public_key),
+    }
+    manual_ciphertext = rsa_encrypt_manual(message.encode(), e, n)
+    library_ciphertext = rsa_encrypt(message, public_key)
+    candidates['rsa_decrypt_manual'] = \
+        lambda: rsa_decrypt_manual(library_ciphertext, p, q, d)
+    candidates['rsa_decrypt'] = \
+        lambda: rsa_decrypt(manual_ciphertext, private_key)
+
+    results = {}
+    for name, function in candidates.items():
+        start = time.perf_counter()
+        for _ in range(count):
+            function()
+        results[name] = count / (time.perf_counter() - start)
+        print(f'{name:<20} {results[name]:10.1f} ops/s')
+    return results
+
+
+if __name__ == '__main__':
+    test_message = b"hello"
+    test_label = b"label"
+    test_modulus_size = 256  # 2048-bit key (256 bytes)
+    padded_message_example = oaep_pad(test_message, test_label,
+                                      test_modulus_size)
+    print("OAEP Padded Message:", padded_message_example.hex())
+
+    benchmark_import_time(__file__)
+    benchmark_rsa_oaep()
+    benchmark_envelopes()
@@ -0,0 +1,643 @@
+"""
+A Merkle tree hashes data in pieces, the leaves, then hashes pairs of
+hashes, level by level, up to a single root. The root commits to every
+leaf, yet a change to one leaf only changes the hashes on its path to the
+root, and a leaf can be shown to belong to the tree with the log2(n)
+sibling hashes along that path, an inclusion proof.
+
+Below, files are split into content-defined chunks, which become the
+leaves of one tree per file. The roots of the file trees, with their paths,
+are the leaves of a tree over the whole directory.
+"""
+
+import bisect
+import hashlib
+import hmac
+import json
+import mmap
+import os
+import shutil
+import tempfile
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+
+from modern_cryptography import CACHE_DIR
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+"""
+Fixed size chunks are ruined by an insertion, every chunk after it shifts.
+Content-defined chunks end where the data itself says so: a gear hash rolls
+over the bytes, h = (h << 1) + gear[byte], and a chunk ends after any byte
+where the low MASK_BITS bits of h are zero, 8 KiB apart on average. Only the
+last MASK_BITS bytes reach those bits, so after an edit the chunk ends
+fall back into step with the old ones within a chunk or two.
+
+Chunks are kept between MIN_CHUNK and MAX_CHUNK bytes. With numpy the hash
+is computed for a whole segment at once. The sum of MASK_BITS shifted gear
+arrays is built by doubling, a sum of 2L terms is a sum of L terms plus the
+same sum L bytes earlier shifted by L, so 13 terms take 6 array passes. The
+arrays are uint16, which keeps the low 13 bits exact. The chunk ends are the
+same as those of the byte by byte loop.
+"""
+
+MASK_BITS = 13
+MIN_CHUNK = 1 << 11
+MAX_CHUNK = 1 << 16
+SEGMENT_SIZE = 1 << 22      # most bytes scanned by numpy at a time
+HASH_BATCH = 256            # chunks hashed per thread pool task
+DIGEST_SIZE = 32
+
+GEAR = [int.from_bytes(hashlib.sha256(bytes([byte])).digest()[:4], 'big')
+        for byte in range(256)]
+GEAR_ARRAY = np.array([gear & 0xFFFF for gear in GEAR], dtype=np.uint16) \
+    if np is not None else None
+
+
+def gear_candidates(data, start: int, end: int) -> list[int]:
+    """
+    Return the positions p in (start, end] where the gear hash of the bytes
+    before p has its low MASK_BITS bits zero. The hash only depends on the
+    MASK_BITS - 1 bytes before start, so segments can be scanned apart.
+    """
+    mask = (1 << MASK_BITS) - 1
+    context = max(0, start - (MASK_BITS - 1))
+    if np is None:
+        h = 0
+        cuts = []
+        for position in range(context, end):
+            h = ((h << 1) + GEAR[data[position]]) & mask
+            if h == 0 and position >= start:
+                cuts.append(position + 1)
+        return cuts
+
+    size = end - context
+    block = GEAR_ARRAY[np.frombuffer(data, np.uint8, size, context)]
+    h = np.zeros(size, dtype=np.uint16)
+    # h gains the terms filled to filled + length for each bit of MASK_BITS.
+    filled = 0
+    length = 1
+    remaining = MASK_BITS
+    while remaining:
+        if remaining & 1:
+            h[filled:] += block[:size - filled] << filled
+            filled += length
+        remaining >>= 1
+        if remaining:
+            doubled = block.copy()
+            doubled[length:] += block[:size - length] << length
+            block = doubled
+            length *= 2
+    cuts = np.flatnonzero((h & mask) == 0) + (context + 1)
+    return cuts[cuts > start].tolist()
+
+
+def cut_points(data, start: int = 0) -> Iterator[int]:
+    # The end of each chunk from start to the end of data, in order.
+    size = len(data)
+    candidates = []
+    index = 0
+    scanned = start
+    # Scan a little at first, a few chunks may be all that is needed.
+    step = MAX_CHUNK
+    chunk_start = start
+    while chunk_start < size:
+        low = chunk_start + MIN_CHUNK
+        high = min(chunk_start + MAX_CHUNK, size)
+        cut = high
+        if low < high:
+            while scanned < high:
+                end = min(scanned + step, size)
+                candidates += gear_candidates(data, scanned, end)
+                scanned = end
+                step = min(2 * step, SEGMENT_SIZE)
+            while index < len(candidates) and candidates[index] < low:
+                index += 1
+            if index < len(candidates) and candidates[index] <= high:
+                cut = candidates[index]
+        yield cut
+        chunk_start = cut
+
+
+"""
+Leaves and nodes are hashed with a one byte prefix, 0 for a chunk, 1 for a
+pair of hashes and 2 for a file root with its path, so that no hash of one
+kind can be passed off as another. A level with an odd number of hashes
+promotes the last one unchanged to the level above.
+
+A level is stored as the concatenation of its 32 byte hashes. When a tree
+is rebuilt after a change, a parent is only hashed again if its two
+children differ from those in the old tree at the same position.
+"""
+
+
+def leaf_hash(chunk: bytes | memoryview) -> bytes:
+    hasher = hashlib.sha256(b'\x00')
+    hasher.update(chunk)
+    return hasher.digest()
+
+
+def node_hash(pair: bytes) -> bytes:
+    return hashlib.sha256(b'\x01' + pair).digest()
+
+
+def file_leaf_hash(path: str, file_root: bytes) -> bytes:
+    return hashlib.sha256(b'\x02' + path.encode() + b'\x00' +
+                          file_root).digest()
+
+
+def build_levels(leaves: bytes, old_levels: list[bytes] | None = None
+                 ) -> tuple[list[bytes], int]:
+    """
+    Build every level above the leaves, reusing parents of old_levels whose
+    children did not change. Returns the levels and the nodes hashed.
+    """
+    levels = [leaves]
+    level = leaves
+    hashed = 0
+    depth = 0
+    while len(level) > DIGEST_SIZE:
+        old_children = old_levels[depth] \
+            if old_levels and depth + 1 < len(old_levels) else None
+        old_parents = old_levels[depth + 1] if old_children else None
+        parents = bytearray()
+        for offset in range(0, len(level), 2 * DIGEST_SIZE):
+            pair = level[offset:offset + 2 * DIGEST_SIZE]
+            if len(pair) == DIGEST_SIZE:
+                parents += pair
+            elif old_children is not None and \
+                    old_children[offset:offset + 2 * DIGEST_SIZE] == pair:
+                parents += old_parents[offset // 2:offset // 2 + DIGEST_SIZE]
+            else:
+                parents += node_hash(pair)
+                hashed += 1
+        level = bytes(parents)
+        levels.append(level)
+        depth += 1
+    return levels, hashed
+
+
+def level_proof(levels: list[bytes], index: int) -> list[tuple[str, str]]:
+    # The sibling of the node at each level, and the side it is on.
+    proof = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling * DIGEST_SIZE < len(level):
+            side = 'left' if sibling < index else 'right'
+            proof.append((side, level[sibling * DIGEST_SIZE:
+                                      (sibling + 1) * DIGEST_SIZE].hex()))
+        index //= 2
+    return proof
+
+
+def fold_proof(node: bytes, proof: list[tuple[str, str]]) -> bytes:
+    for side, sibling in proof:
+        sibling = bytes.fromhex(sibling)
+        node = node_hash(sibling + node if side == 'left' else node + sibling)
+    return node
+
+
+def verify_proof(chunk: bytes, proof: dict, root: bytes | str) -> bool:
+    """
+    Check that chunk is the chunk of the file named in a proof from
+    MerkleIndex.proof, under the directory root.
+    """
+    if isinstance(root, str):
+        root = bytes.fromhex(root)
+    file_root = fold_proof(leaf_hash(chunk), proof['file_proof'])
+    node = fold_proof(file_leaf_hash(proof['path'], file_root),
+                      proof['index_proof'])
+    return hmac.compare_digest(node, root)
+
+
+class ChunkStore:
+    """
+    Chunks stored once each, in a file named by their leaf hash, however
+    many files or positions they appear in.
+    """
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def path(self, leaf: bytes) -> str:
+        name = leaf.hex()
+        return os.path.join(self.directory, name[:2], name)
+
+    def put(self, leaf: bytes, chunk: bytes | memoryview) -> bool:
+        # Returns False if the chunk was already stored.
+        path = self.path(leaf)
+        if os.path.exists(path):
+            return False
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # A unique temporary name, as threads may store the same chunk.
+        descriptor, temporary = tempfile.mkstemp(dir=directory,
+                                                 suffix='.tmp')
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(chunk)
+        os.replace(temporary, path)
+        return True
+
+    def get(self, leaf: bytes) -> bytes:
+        with open(self.path(leaf), 'rb') as file:
+            chunk = file.read()
+        if leaf_hash(chunk) != leaf:
+            raise ValueError(f'Chunk {leaf.hex()} is corrupted.')
+        return chunk
+
+
+class MappedFile:
+    # A read only view of a file, memory mapped unless it is empty.
+    def __init__(self, path: str) -> None:
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._mapped = mmap.mmap(self._file.fileno(), 0,
+                                 access=mmap.ACCESS_READ) if size else None
+        self.data = self._mapped if size else b''
+
+    def __enter__(self) -> 'MappedFile':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._mapped is not None:
+            self._mapped.close()
+        self._file.close()
+
+
+class MerkleIndex:
+    """
+    A Merkle tree over every file under a directory, persisted at index_path
+    as a journal of JSON lines. For each file the size, mtime, chunk ends and
+    the levels of its tree are kept. save() appends a line for each file
+    changed since the last save, and rewrites the journal with one line per
+    file once it holds more than twice as many lines as there are files.
+    The directory tree is rebuilt from the file roots on loading.
+
+    update() reads only files whose size or mtime changed. update_range()
+    is told which bytes of a file changed, and reads from the chunk holding
+    the first of them until the chunk ends fall back into step with the old
+    ones, hashing only those chunks and their paths to the root. New chunks
+    are written to the chunk store, if one is given, once per leaf hash.
+
+    index_path defaults to a file under CACHE_DIR. With the cache turned
+    off, the index is kept in memory only.
+    """
+    VERSION = 2
+
+    def __init__(self, directory: str, index_path: str | None = None,
+                 store: ChunkStore | None = None,
+                 workers: int | None = None) -> None:
+        self.directory = directory
+        if index_path is None and CACHE_DIR is not None:
+            name = hashlib.sha256(
+                os.path.abspath(directory).encode()).hexdigest()[:32]
+            index_path = os.path.join(CACHE_DIR, 'merkle', name + '.json')
+        self.index_path = index_path
+        self.store = store
+        self.workers = workers or os.cpu_count() or 1
+        self.files: dict[str, dict] = {}
+        self.paths: list[str] = []
+        self.index_levels: list[bytes] = []
+        # Files changed since the last save, and the lines in the journal,
+        # None if it must be rewritten in full.
+        self.changed: set[str] = set()
+        self.journal_lines: int | None = None
+        self.load()
+
+    def header(self) -> dict:
+        return {'version': self.VERSION,
+                'chunking': [MASK_BITS, MIN_CHUNK, MAX_CHUNK]}
+
+    def load(self) -> None:
+        if self.index_path is None or not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, 'rb') as file:
+            # An index chunked with other parameters cannot be reused.
+            try:
+                if json.loads(file.readline()) != self.header():
+                    return
+            except ValueError:
+                return
+            lines = 0
+            for line in file:
+                try:
+                    # A line cut short by a crash ends the journal.
+                    if not line.endswith(b'\n'):
+                        raise ValueError
+                    record = json.loads(line)
+                except ValueError:
+                    lines = None
+                    break
+                lines += 1
+                if record.get('removed'):
+                    self.files.pop(record['path'], None)
+                    continue
+                self.files[record['path']] = {
+                    'size': record['size'], 'mtime_ns': record['mtime_ns'],
+                    'cuts': record['cuts'],
+                    'levels': [bytes.fromhex(level)
+                               for level in record['levels']]}
+        self.journal_lines = lines
+        if self.files:
+            self.rebuild_index({'nodes': 0})
+
+    def record(self, path: str) -> str:
+        # The journal line of one file, or of its removal.
+        entry = self.files.get(path)
+        if entry is None:
+            return json.dumps({'path': path, 'removed': True}) + '\n'
+        return json.dumps({
+            'path': path, 'size': entry['size'],
+            'mtime_ns': entry['mtime_ns'], 'cuts': entry['cuts'],
+            'levels': [level.hex() for level in entry['levels']]}) + '\n'
+
+    def save(self) -> None:
+        if self.index_path is None:
+            self.changed.clear()
+            return
+        lines = self.journal_lines
+        if lines is not None and \
+                lines + len(self.changed) <= 2 * max(len(self.files), 1):
+            with open(self.index_path, 'a') as file:
+                for path in sorted(self.changed):
+                    file.write(self.record(path))
+            self.journal_lines = lines + len(self.changed)
+            self.changed.clear()
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)),
+                    exist_ok=True)
+        temporary = self.index_path + '.tmp'
+        with open(temporary, 'w') as file:
+            file.write(json.dumps(self.header()) + '\n')
+            for path in sorted(self.files):
+                file.write(self.record(path))
+        os.replace(temporary, self.index_path)
+        self.journal_lines = len(self.files)
+        self.changed.clear()
+
+    def root(self) -> bytes:
+        if not self.index_levels:
+            return hashlib.sha256(b'').digest()
+        return self.index_levels[-1]
+
+    def file_root(self, path: str) -> bytes:
+        return self.files[path]['levels'][-1]
+
+    def walk(self) -> Iterator[tuple[str, str]]:
+        # Regular files under the directory, skipping the index and store.
+        skip = {os.path.abspath(self.index_path),
+                os.path.abspath(self.index_path) + '.tmp'} \
+            if self.index_path else set()
+        store = os.path.abspath(self.store.directory) + os.sep \
+            if self.store else None
+        for directory, directories, files in os.walk(self.directory):
+            directories.sort()
+            for name in sorted(files):
+                path = os.path.join(directory, name)
+                absolute = os.path.abspath(path)
+                if absolute in skip or store and absolute.startswith(store) \
+                        or os.path.islink(path) or not os.path.isfile(path):
+                    continue
+                relative = os.path.relpath(path, self.directory)
+                yield relative.replace(os.sep, '/'), path
+
+    def hash_chunks(self, data, spans: list[tuple[int, int]],
+                    stats: dict[str, int]) -> bytes:
+        """
+        Hash the chunks at spans of data on a thread pool, hashlib releases
+        the GIL for large inputs, storing new chunks if there is a store.
+        """
+        view = memoryview(data)
+
+        def hash_batch(batch: list[tuple[int, int]]) -> tuple[bytes, int]:
+            leaves = bytearray()
+            duplicates = 0
+            for start, end in batch:
+                chunk = view[start:end]
+                leaf = leaf_hash(chunk)
+                leaves += leaf
+                if self.store is not None and not self.store.put(leaf, chunk):
+                    duplicates += 1
+            return bytes(leaves), duplicates
+
+        batches = [spans[index:index + HASH_BATCH]
+                   for index in range(0, len(spans), HASH_BATCH)]
+        try:
+            if self.workers == 1 or len(batches) == 1:
+                results = list(map(hash_batch, batches))
+            else:
+                with ThreadPoolExecutor(self.workers) as executor:
+                    results = list(executor.map(hash_batch, batches))
+        finally:
+            view.release()
+        stats['duplicates'] += sum(duplicates for _, duplicates in results)
+        stats['hashed'] += len(spans)
+        stats['bytes'] += sum(end - start for start, end in spans)
+        return b''.join(leaves for leaves, _ in results)
+
+    def index_file(self, relative: str, path: str,
+                   stats: dict[str, int]) -> None:
+        # Chunk and hash a whole file, reusing unchanged nodes of its tree.
+        stat = os.stat(path)
+        with MappedFile(path) as mapped:
+            cuts = list(cut_points(mapped.data)) or [0]
+            spans = list(zip([0] + cuts[:-1], cuts))
+            leaves = self.hash_chunks(mapped.data, spans, stats)
+        old = self.files.get(relative)
+        levels, hashed = build_levels(leaves, old and old['levels'])
+        stats['nodes'] += hashed
+        self.files[relative] = {'size': stat.st_size,
+                                'mtime_ns': stat.st_mtime_ns,
+                                'cuts': cuts, 'levels': levels}
+        self.changed.add(relative)
+
+    def update(self) -> dict[str, int]:
+        """
+        Bring the index up to date with the directory, reading only files
+        whose size or mtime changed, then rebuild the directory tree.
+        """
+        stats = {'files': 0, 'changed': 0, 'removed': 0, 'hashed': 0,
+                 'bytes': 0, 'nodes': 0, 'duplicates': 0}
+        seen = set()
+        for relative, path in self.walk():
+            seen.add(relative)
+            stats['files'] += 1
+            stat = os.stat(path)
+            entry = self.files.get(relative)
+            if entry and entry['size'] == stat.st_size and \
+                    entry['mtime_ns'] == stat.st_mtime_ns:
+                continue
+            stats['changed'] += 1
+            self.index_file(relative, path, stats)
+        for relative in set(self.files) - seen:
+            del self.files[relative]
+            self.changed.add(relative)
+            stats['removed'] += 1
+        self.rebuild_index(stats)
+        return stats
+
+    def update_range(self, relative: str, start: int,
+                     end: int) -> dict[str, int]:
+        """
+        Update one file after the bytes from start to end, in the new file,
+        were written. The bytes before start must be unchanged, and those
+        from end on must be the old bytes shifted by the change in size, as
+        for an overwrite, insertion, deletion or append.
+        """
+        stats = {'files': 1, 'changed': 1, 'removed': 0, 'hashed': 0,
+                 'bytes': 0, 'nodes': 0, 'duplicates': 0}
+        path = os.path.join(self.directory, relative)
+        entry = self.files.get(relative)
+        stat = os.stat(path)
+        if entry is None or entry['size'] == 0 or stat.st_size == 0:
+            self.index_file(relative, path, stats)
+            self.rebuild_index(stats)
+            return stats
+
+        cuts = entry['cuts']
+        delta = stat.st_size - entry['size']
+        # Chunk again from the start of the chunk holding start, an append
+        # starts from the old last chunk, which ended at the end of file.
+        first = min(bisect.bisect_right(cuts, start), len(cuts) - 1)
+        old_positions = {cut: index
+                         for index, cut in enumerate(cuts[first:], first)}
+        new_cuts = cuts[:first]
+        resumed = None
+        with MappedFile(path) as mapped:
+            for cut in cut_points(mapped.data, cuts[first - 1] if first
+                                  else 0):
+                new_cuts.append(cut)
+                if cut >= end and cut < stat.st_size and \
+                        cut - delta in old_positions:
+                    resumed = old_positions[cut - delta]
+                    break
+            spans = list(zip([cuts[first - 1] if first else 0] +
+                             new_cuts[first:-1], new_cuts[first:]))
+            leaves = self.hash_chunks(mapped.data, spans, stats)
+
+        old_leaves = entry['levels'][0]
+        leaves = old_leaves[:first * DIGEST_SIZE] + leaves
+        if resumed is not None:
+            new_cuts += [cut + delta for cut in cuts[resumed + 1:]]
+            leaves += old_leaves[(resumed + 1) * DIGEST_SIZE:]
+        levels, hashed = build_levels(leaves, entry['levels'])
+        stats['nodes'] += hashed
+        self.files[relative] = {'size': stat.st_size,
+                                'mtime_ns': stat.st_mtime_ns,
+                                'cuts': new_cuts, 'levels': levels}
+        self.changed.add(relative)
+        self.rebuild_index(stats)
+        return stats
+
+    def rebuild_index(self, stats: dict[str, int]) -> None:
+        self.paths = sorted(self.files)
+        leaves = b''.join(file_leaf_hash(path, self.file_root(path))
+                          for path in self.paths)
+        self.index_levels, hashed = build_levels(leaves, self.index_levels) \
+            if leaves else ([], 0)
+        stats['nodes'] += hashed
+
+    def proof(self, relative: str, chunk: int) -> dict:
+        """
+        The inclusion proof of one chunk of a file: its position, the
+        siblings up its file tree, then up the directory tree.
+        """
+        entry = self.files[relative]
+        if not 0 <= chunk < len(entry['cuts']):
+            raise ValueError(f'{relative} has no chunk {chunk}.')
+        offset = entry['cuts'][chunk - 1] if chunk else 0
+        return {
+            'path': relative,
+            'chunk': chunk,
+            'offset': offset,
+            'length': entry['cuts'][chunk] - offset,
+            'file_proof': level_proof(entry['levels'], chunk),
+            'index_proof': level_proof(
+                self.index_levels,
+                bisect.bisect_left(self.paths, relative)),
+        }
+
+    def restore(self, relative: str, out_path: str) -> int:
+        # Rebuild a file from the chunk store, returning bytes written.
+        if self.store is None:
+            raise ValueError('Restoring needs a chunk store.')
+        leaves = self.files[relative]['levels'][0]
+        total = 0
+        with open(out_path, 'wb') as file:
+            for offset in range(0, len(leaves), DIGEST_SIZE):
+                total += file.write(
+                    self.store.get(leaves[offset:offset + DIGEST_SIZE]))
+        return total
+
+
+def benchmark_merkle(size: int = 1 << 26) -> dict[str, float]:
+    """
+    Index a file of size random bytes, compare with hashing it whole, then
+    time updates after an overwrite and an insertion in the middle, and
+    index a second copy into a chunk store to show the deduplication.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        data_dir = os.path.join(directory, 'data')
+        os.makedirs(data_dir)
+        path = os.path.join(data_dir, 'large')
+        with open(path, 'wb') as file:
+            file.write(os.urandom(size))
+        index = MerkleIndex(data_dir, os.path.join(directory, 'index.json'),
+                            ChunkStore(os.path.join(directory, 'chunks')))
+        results = {}
+
+        start = time.perf_counter()
+        with open(path, 'rb') as file:
+            hashlib.file_digest(file, 'sha256')
+        results['sha256 whole file s'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        stats = index.update()
+        results['index build s'] = time.perf_counter() - start
+        print(f"{'sha256 of the whole file':<28} "
+              f"{results['sha256 whole file s']:8.3f} s")
+        print(f"{'index build and store':<28} {results['index build s']:8.3f}"
+              f" s, {stats['hashed']} chunks")
+
+        middle = size // 2
+        with open(path, 'r+b') as file:
+            file.seek(middle)
+            file.write(b'overwritten')
+        start = time.perf_counter()
+        stats = index.update_range('large', middle, middle + 11)
+        results['overwrite s'] = time.perf_counter() - start
+        print(f"{'update after overwrite':<28} {results['overwrite s']:8.3f}"
+              f" s, {stats['hashed']} chunks, {stats['nodes']} nodes")
+
+        with open(path, 'rb') as file:
+            content = file.read()
+        with open(path, 'wb') as file:
+            file.write(content[:middle] + b'inserted' + content[middle:])
+        start = time.perf_counter()
+        stats = index.update_range('large', middle, middle + 8)
+        results['insertion s'] = time.perf_counter() - start
+        print(f"{'update after insertion':<28} {results['insertion s']:8.3f}"
+              f" s, {stats['hashed']} chunks, {stats['nodes']} nodes")
+
+        shutil.copyfile(path, os.path.join(data_dir, 'copy'))
+        stats = index.update()
+        print(f"{'index a copy':<28} {stats['duplicates']} of "
+              f"{stats['hashed']} chunks already stored")
+
+        proof = index.proof('large', 3)
+        chunk = content[proof['offset']:proof['offset'] + proof['length']]
+        assert verify_proof(chunk, proof, index.root())
+        index.save()
+        return results
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    benchmark_merkle()
@@ -0,0 +1,312 @@
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable, Iterator
+
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from modern_cryptography import load_module
+
+
+"""
+Each numbered module implements a primitive with a library and again by
+hand. This suite loads all eight modules by file name and times the manual
+and library versions side by side, over a range of input and key sizes:
+
+    hash        sha_256, sha_256_fast and hashlib.sha256
+    modexp      fast_power, sliding_window_power and pow
+    hmac        h_mac, hmac_context and hmac.new
+    oaep        oaep_pad, rsa_encrypt_manual and rsa_decrypt_manual against
+                rsa_encrypt and rsa_decrypt from cryptography
+    cipher      des, triple_des and aes, per message and with a context
+
+Every workload reports operations and megabytes per second, latency
+percentiles in microseconds and the peak memory traced during one call.
+Results are written as JSON. With --compare, the results are checked against
+a stored baseline and the exit code is 1 if any workload lost more than
+--threshold of its throughput.
+"""
+
+MODULE_FILES = (
+    '01_hash_functions',
+    '02_digital_signatures',
+    '03_message_authentification_codes',
+    '04_blockchain',
+    '05_key_exchange_protocols',
+    '06_des_and_triple_des',
+    '07_aes',
+    '08_rsa_cipher',
+)
+
+INPUT_SIZES = (64, 1024, 16384)
+KEY_SIZES = (1024, 2048)
+PERCENTILES = (50, 90, 99)
+
+Workload = tuple[str, dict, int, Callable[[], object]]
+
+
+def load_modules() -> dict[str, object]:
+    return {file_name[3:]: load_module(file_name)
+            for file_name in MODULE_FILES}
+
+
+def hash_workloads(modules: dict, sizes: tuple[int, ...]
+                   ) -> Iterator[Workload]:
+    hashing = modules['hash_functions']
+    for size in sizes:
+        message = 'a' * size
+        yield ('hash/hashlib', {'size': size}, size,
+               lambda m=message.encode(): hashlib.sha256(m).digest())
+        yield ('hash/sha_256_fast', {'size': size}, size,
+               lambda m=message: hashing.sha_256_fast(m))
+        # The bit string implementation is too slow for large inputs.
+        if size <= 1024:
+            yield ('hash/sha_256', {'size': size}, size,
+                   lambda m=message: hashing.sha_256(m))
+
+
+def modexp_workloads(modules: dict, key_sizes: tuple[int, ...]
+                     ) -> Iterator[Workload]:
+    signatures = modules['digital_signatures']
+    generator = random.Random(0)
+    for bits in key_sizes:
+        mod = generator.getrandbits(bits) | 1 << bits - 1 | 1
+        exponent = generator.getrandbits(bits) | 1 << bits - 1
+        base = generator.randrange(2, mod)
+        steps = signatures.sliding_window_schedule(exponent)
+        yield ('modexp/pow', {'bits': bits}, 0,
+               lambda b=base, t=exponent, m=mod: pow(b, t, m))
+        yield ('modexp/sliding_window_power', {'bits': bits}, 0,
+               lambda s=steps, b=base, m=mod:
+               signatures.sliding_window_power(b, s, m))
+        yield ('modexp/fast_power', {'bits': bits}, 0,
+               lambda b=base, t=exponent, m=mod:
+               signatures.fast_power(b, t, m))
+
+
+def hmac_workloads(modules: dict, sizes: tuple[int, ...]
+                   ) -> Iterator[Workload]:
+    macs = modules['message_authentification_codes']
+    key = 'benchmark key'
+    for size in sizes:
+        message = 'a' * size
+        yield ('hmac/hmac', {'size': size}, size,
+               lambda m=message.encode(): hmac.new(key.encode(), m,
+                                                    'sha256').hexdigest())
+        yield ('hmac/hmac_context', {'size': size}, size,
+               lambda m=message: macs.hmac_context(key).hexdigest(m))
+        yield ('hmac/h_mac', {'size': size}, size,
+               lambda m=message: macs.h_mac(m, key))
+
+
+def oaep_workloads(modules: dict, key_sizes: tuple[int, ...]
+                   ) -> Iterator[Workload]:
+    cipher = modules['rsa_cipher']
+    message = 'benchmark message'
+    for bits in key_sizes:
+        key = rsa.generate_private_key(public_exponent=65537, key_size=bits)
+        public_key = key.public_key()
+        numbers = key.private_numbers()
+        p, q, d = numbers.p, numbers.q, numbers.d
+        e, n = numbers.public_numbers.e, numbers.public_numbers.n
+        modulus_size = (bits + 7) // 8
+        size = len(message)
+        ciphertext = cipher.rsa_encrypt(message, public_key)
+
+        yield ('oaep/oaep_pad', {'bits': bits}, size,
+               lambda s=modulus_size:
+               cipher.oaep_pad(message.encode(), b'', s))
+        yield ('oaep/rsa_encrypt', {'bits': bits}, size,
+               lambda k=public_key: cipher.rsa_encrypt(message, k))
+        yield ('oaep/rsa_encrypt_manual', {'bits': bits}, size,
+               lambda e=e, n=n:
+               cipher.rsa_encrypt_manual(message.encode(), e, n))
+        yield ('oaep/rsa_decrypt', {'bits': bits}, size,
+               lambda k=key, c=ciphertext: cipher.rsa_decrypt(c, k))
+        yield ('oaep/rsa_decrypt_manual', {'bits': bits}, size,
+               lambda c=ciphertext, p=p, q=q, d=d:
+               cipher.rsa_decrypt_manual(c, p, q, d))
+
+
+def cipher_workloads(modules: dict, sizes: tuple[int, ...]
+                     ) -> Iterator[Workload]:
+    des = modules['des_and_triple_des']
+    aes = modules['aes']
+    ciphers = (
+        ('des', des.des_encrypt, des.des_context, os.urandom(8)),
+        ('triple_des', des.triple_des_encrypt, des.triple_des_context,
+         bytes.fromhex('0123456789abcdeffedcba987654321089abcdef01234567')),
+        ('aes', aes.aes_encrypt, aes.aes_context, os.urandom(32)),
+    )
+    for size in sizes:
+        message = 'a' * size
+        for name, encrypt, context, key in ciphers:
+            yield (f'cipher/{name}_encrypt', {'size': size}, size,
+                   lambda f=encrypt, m=message, k=key: f(m, k))
+            yield (f'cipher/{name}_context', {'size': size}, size,
+                   lambda c=context, m=message.encode(), k=key:
+                   c(k).encrypt(m))
+
+
+WORKLOADS = {
+    'hash': (hash_workloads, INPUT_SIZES),
+    'modexp': (modexp_workloads, KEY_SIZES),
+    'hmac': (hmac_workloads, INPUT_SIZES),
+    'oaep': (oaep_workloads, KEY_SIZES),
+    'cipher': (cipher_workloads, INPUT_SIZES),
+}
+
+
+def workload_key(name: str, parameters: dict) -> str:
+    return name + ''.join(f'/{key}={value}'
+                          for key, value in sorted(parameters.items()))
+
+
+def percentile(samples: list[int], percent: int) -> int:
+    # Nearest rank percentile of sorted samples.
+    index = max(0, -(-len(samples) * percent // 100) - 1)
+    return samples[index]
+
+
+def measure(function: Callable[[], object], size: int,
+            min_time: float = 0.2, max_calls: int = 100_000) -> dict:
+    """
+    Time single calls until min_time has passed, then take the throughput
+    and latency percentiles from the samples. Allocations are measured in
+    a separate call, as tracemalloc slows every allocation down.
+    """
+    function()
+    samples = []
+    clock = time.perf_counter_ns
+    deadline = clock() + int(min_time * 1e9)
+    while len(samples) < max_calls:
+        start = clock()
+        function()
+        end = clock()
+        samples.append(end - start)
+        if end > deadline:
+            break
+    total = sum(samples) / 1e9
+    samples.sort()
+
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        function()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+    result = {
+        'calls': len(samples),
+        'ops_per_second': len(samples) / total,
+        'mb_per_second': len(samples) * size / total / 1e6,
+        'peak_bytes': peak,
+    }
+    for percent in PERCENTILES:
+        result[f'p{percent}_us'] = percentile(samples, percent) / 1e3
+    return result
+
+
+def run_suite(groups: tuple[str, ...] = tuple(WORKLOADS),
+              name_filter: str = '', min_time: float = 0.2,
+              quick: bool = False) -> dict:
+    # quick runs only the smallest input and key size of each group.
+    modules = load_modules()
+    results = {}
+    for group in groups:
+        make_workloads, sizes = WORKLOADS[group]
+        for name, parameters, size, function in make_workloads(
+                modules, sizes[:1] if quick else sizes):
+            key = workload_key(name, parameters)
+            if name_filter not in key:
+                continue
+            results[key] = {'parameters': parameters,
+                            **measure(function, size, min_time)}
+            print_result(key, results[key])
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+
+def print_result(key: str, result: dict) -> None:
+    print(f"{key:<44} {result['ops_per_second']:12.1f} ops/s "
+          f"{result['mb_per_second']:9.2f} MB/s "
+          f"p50 {result['p50_us']:10.1f} us "
+          f"p99 {result['p99_us']:10.1f} us "
+          f"peak {result['peak_bytes']:9d} B")
+
+
+def write_results(report: dict, path: str) -> None:
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(report, file, indent=2)
+    os.replace(temporary, path)
+
+
+def compare(report: dict, baseline: dict,
+            threshold: float = 0.1) -> list[str]:
+    """
+    Return the workloads whose throughput fell by more than threshold,
+    as a fraction of the baseline. Workloads missing from either side
+    are skipped.
+    """
+    regressions = []
+    for key, result in report['results'].items():
+        before = baseline['results'].get(key)
+        if before is None:
+            continue
+        change = result['ops_per_second'] / before['ops_per_second'] - 1
+        flag = ''
+        if change < -threshold:
+            regressions.append(key)
+            flag = '  REGRESSION'
+        print(f'{key:<44} {change:+8.1%}{flag}')
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description='Benchmark manual and library implementations.')
+    parser.add_argument('--groups', nargs='+', choices=tuple(WORKLOADS),
+                        default=tuple(WORKLOADS))
+    parser.add_argument('--filter', default='',
+                        help='only run workloads containing this string')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='seconds to time each workload for')
+    parser.add_argument('--quick', action='store_true',
+                        help='only the smallest input and key sizes')
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='fail on regressions against a JSON baseline')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='allowed throughput loss for --compare')
+    args = parser.parse_args(argv)
+
+    report = run_suite(tuple(args.groups), args.filter, args.min_time,
+                       args.quick)
+    if args.output:
+        write_results(report, args.output)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} workloads regressed by more than '
+                  f'{args.threshold:.0%}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,233 @@
+import contextlib
+import cProfile
+import functools
+import io
+import pstats
+import sys
+import threading
+import time
+from collections.abc import Iterator
+
+from modern_cryptography import load_module
+
+
+"""
+Opt-in counters for the hot entry points of the numbered modules. enable()
+replaces each primitive below with a wrapper, on its module or class, that
+records the number of calls, the bytes of its input and a histogram of its
+latency. disable() puts the original functions back, so there is no
+overhead at all while instrumentation is off.
+
+Latency buckets are powers of two in microseconds, bucket k counts calls
+that took less than 2^k us, and the last bucket counts everything slower.
+snapshot() returns the counters as a dict, prometheus_text() in the
+Prometheus text exposition format, and profile() runs cProfile around a
+block of work.
+"""
+
+# (module file, attribute path, index of the argument holding the input)
+PRIMITIVES = {
+    'sha_256': ('01_hash_functions', 'sha_256', 0),
+    'digital_signature': ('02_digital_signatures', 'digital_signature', 0),
+    'h_mac': ('03_message_authentification_codes', 'h_mac', 0),
+    'add_block': ('04_blockchain', 'Blockchain.add_block', 1),
+    'aes_encrypt': ('07_aes', 'aes_encrypt', 0),
+    'rsa_decrypt': ('08_rsa_cipher', 'rsa_decrypt', 0),
+}
+
+LATENCY_BUCKETS = 25    # 1 us to 16 s, then +Inf
+
+_lock = threading.Lock()
+_stats: dict[str, 'PrimitiveStats'] = {}
+_originals: dict[str, tuple[object, str, object]] = {}
+
+
+class PrimitiveStats:
+    # Counters for one primitive, updated under the module lock.
+    __slots__ = ('calls', 'errors', 'bytes', 'seconds', 'buckets')
+
+    def __init__(self) -> None:
+        self.clear()
+
+    def clear(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.buckets = [0] * (LATENCY_BUCKETS + 1)
+
+    def record(self, elapsed_ns: int, size: int, failed: bool) -> None:
+        bucket = min((elapsed_ns // 1000).bit_length(), LATENCY_BUCKETS)
+        with _lock:
+            self.calls += 1
+            self.errors += failed
+            self.bytes += size
+            self.seconds += elapsed_ns / 1e9
+            self.buckets[bucket] += 1
+
+
+def input_size(value) -> int:
+    if isinstance(value, str):
+        return len(value.encode())
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    return 0
+
+
+def instrument(function, stats: PrimitiveStats, argument: int):
+    clock = time.perf_counter_ns
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = clock()
+        failed = True
+        try:
+            result = function(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            size = input_size(args[argument]) if len(args) > argument else 0
+            stats.record(clock() - start, size, failed)
+
+    return wrapper
+
+
+def enable(primitives: list[str] | None = None) -> None:
+    """
+    Wrap the named primitives, all of them by default. Counters are kept
+    across disable() and enable(), use reset() to clear them.
+    """
+    for name in primitives or PRIMITIVES:
+        if name in _originals:
+            continue
+        file_name, path, argument = PRIMITIVES[name]
+        owner = load_module(file_name)
+        *parents, attribute = path.split('.')
+        for parent in parents:
+            owner = getattr(owner, parent)
+        original = getattr(owner, attribute)
+        stats = _stats.setdefault(name, PrimitiveStats())
+        setattr(owner, attribute, instrument(original, stats, argument))
+        _originals[name] = (owner, attribute, original)
+
+
+def disable() -> None:
+    # Restore every wrapped primitive.
+    for name in list(_originals):
+        owner, attribute, original = _originals.pop(name)
+        setattr(owner, attribute, original)
+
+
+def enabled() -> list[str]:
+    return list(_originals)
+
+
+def reset() -> None:
+    # Zero the counters in place, as the wrappers hold on to them.
+    with _lock:
+        for stats in _stats.values():
+            stats.clear()
+
+
+def snapshot() -> dict[str, dict]:
+    """
+    Copy the counters of every primitive seen so far. Buckets are keyed by
+    their upper bound in microseconds, 'inf' for the last one.
+    """
+    with _lock:
+        bounds = [str(1 << k) for k in range(LATENCY_BUCKETS)] + ['inf']
+        result = {}
+        for name, stats in _stats.items():
+            result[name] = {
+                'calls': stats.calls,
+                'errors': stats.errors,
+                'bytes': stats.bytes,
+                'seconds': stats.seconds,
+                'latency_us': dict(zip(bounds, stats.buckets)),
+            }
+        return result
+
+
+def prometheus_text(prefix: str = 'modern_crypto') -> str:
+    # Counters and cumulative latency histograms, one series per primitive.
+    lines = [
+        f'# HELP {prefix}_calls_total Calls to each primitive.',
+        f'# TYPE {prefix}_calls_total counter',
+    ]
+    data = snapshot()
+    for name, stats in data.items():
+        lines.append(f'{prefix}_calls_total{{primitive="{name}"}} '
+                     f'{stats["calls"]}')
+    lines += [f'# HELP {prefix}_errors_total Calls that raised.',
+              f'# TYPE {prefix}_errors_total counter']
+    for name, stats in data.items():
+        lines.append(f'{prefix}_errors_total{{primitive="{name}"}} '
+                     f'{stats["errors"]}')
+    lines += [f'# HELP {prefix}_bytes_total Input bytes processed.',
+              f'# TYPE {prefix}_bytes_total counter']
+    for name, stats in data.items():
+        lines.append(f'{prefix}_bytes_total{{primitive="{name}"}} '
+                     f'{stats["bytes"]}')
+
+    metric = f'{prefix}_latency_seconds'
+    lines += [f'# HELP {metric} Latency of each primitive.',
+              f'# TYPE {metric} histogram']
+    for name, stats in data.items():
+        total = 0
+        for bound, count in stats['latency_us'].items():
+            total += count
+            le = '+Inf' if bound == 'inf' else repr(int(bound) / 1e6)
+            lines.append(f'{metric}_bucket{{primitive="{name}",le="{le}"}} '
+                         f'{total}')
+        lines.append(f'{metric}_sum{{primitive="{name}"}} '
+                     f'{stats["seconds"]}')
+        lines.append(f'{metric}_count{{primitive="{name}"}} '
+                     f'{stats["calls"]}')
+    return '\n'.join(lines) + '\n'
+
+
+@contextlib.contextmanager
+def profile(path: str | None = None, sort_by: str = 'cumulative',
+            limit: int = 20, stream=None) -> Iterator[cProfile.Profile]:
+    """
+    Run cProfile around the block. The stats are dumped to path if given,
+    and the top limit functions are printed to stream, stdout by default.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path:
+            profiler.dump_stats(path)
+        if limit:
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats(
+                sort_by).print_stats(limit)
+            print(output.getvalue(), file=stream or sys.stdout)
+
+
+def benchmark_instrumentation(count: int = 100_000) -> dict[str, float]:
+    """
+    Calls per second of h_mac before enable(), while enabled and after
+    disable(), to show the cost of the wrapper and that disable removes it.
+    """
+    macs = load_module('03_message_authentification_codes')
+    results = {}
+    for state in ('disabled', 'enabled', 'disabled again'):
+        if state == 'enabled':
+            enable(['h_mac'])
+        elif state == 'disabled again':
+            disable()
+        start = time.perf_counter()
+        for _ in range(count):
+            macs.h_mac('message', 'key')
+        results[state] = count / (time.perf_counter() - start)
+        print(f'{state:<16} {results[state]:12.1f} calls/s')
+    return results
+
+
+if __name__ == '__main__':
+    benchmark_instrumentation()
+    print(prometheus_text())
@@ -0,0 +1,129 @@
+import functools
+import importlib.util
+import os
+import queue
+import sys
+
+
+"""
+The numbered files of this repository cannot be imported by name, as module
+names may not start with a digit. This package loads them by path, the
+first time each attribute below is used:
+
+    import modern_cryptography
+    modern_cryptography.hash_functions.sha_256_fast(b'abc')
+
+The command line interface is run with python -m modern_cryptography.
+"""
+
+MODULES = {
+    'hash_functions': '01_hash_functions',
+    'digital_signatures': '02_digital_signatures',
+    'message_authentification_codes': '03_message_authentification_codes',
+    'blockchain': '04_blockchain',
+    'key_exchange_protocols': '05_key_exchange_protocols',
+    'des_and_triple_des': '06_des_and_triple_des',
+    'aes': '07_aes',
+    'rsa_cipher': '08_rsa_cipher',
+    'merkle_trees': '09_merkle_trees',
+}
+
+__all__ = list(MODULES)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+"""
+Diffie-Hellman groups, the file cache of the command line interface and
+Merkle indexes are kept under CACHE_DIR, the directory named by the
+MODERN_CRYPTO_CACHE environment variable, ~/.cache/modern_cryptography if
+it is unset. Setting it to an empty string turns these caches off, and
+CACHE_DIR is None. Private example keys are only written to it when the
+variable is set, see example_keys.
+"""
+
+CACHE_DIR = os.environ.get(
+    'MODERN_CRYPTO_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'modern_cryptography')
+) or None
+
+
+def load_module(file_name: str):
+    """
+    Load a numbered module from the repository root, once per process. It is
+    registered in sys.modules under its file name, so the numbered modules
+    and the scripts next to them share one copy of each.
+    """
+    if file_name in sys.modules:
+        return sys.modules[file_name]
+    path = os.path.join(ROOT, file_name + '.py')
+    spec = importlib.util.spec_from_file_location(file_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[file_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def doubling_counts(maximum: int | None = None) -> list[int]:
+    # Worker counts 1, 2, 4, ... below maximum, then maximum itself, which
+    # defaults to the number of CPUs.
+    maximum = maximum or os.cpu_count() or 1
+    counts = []
+    count = 1
+    while count < maximum:
+        counts.append(count)
+        count *= 2
+    counts.append(maximum)
+    return counts
+
+
+def call_worker(file_name: str, name: str, *args):
+    # Run in a child process, where the numbered module is loaded by path.
+    return getattr(load_module(file_name), name)(*args)
+
+
+def process_worker(function) -> functools.partial:
+    """
+    Functions of the numbered modules pickle by the name of their module,
+    which a child process started with spawn or forkserver cannot import.
+    The returned callable pickles as call_worker instead, so process pools
+    and processes run these functions under every start method.
+    """
+    path = sys.modules[function.__module__].__file__
+    file_name = os.path.splitext(os.path.basename(path))[0]
+    return functools.partial(call_worker, file_name, function.__name__)
+
+
+def collect_results(results, processes: list, poll: float = 1.0) -> list:
+    """
+    Get one result per process from the results queue, polling every poll
+    seconds. A process that exits with a non zero code, or every process
+    exiting with results still missing, terminates the others and raises
+    RuntimeError, rather than waiting on the queue forever.
+    """
+    collected = []
+    while len(collected) < len(processes):
+        try:
+            collected.append(results.get(timeout=poll))
+            continue
+        except queue.Empty:
+            pass
+        failed = [process for process in processes
+                  if process.exitcode not in (None, 0)]
+        if failed or all(process.exitcode == 0 for process in processes):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+            if failed:
+                raise RuntimeError(f'Worker process {failed[0].pid} exited '
+                                   f'with code {failed[0].exitcode}.')
+            raise RuntimeError('Worker processes exited without a result.')
+    return collected
+
+
+def __getattr__(name: str):
+    if name not in MODULES:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    module = load_module(MODULES[name])
+    globals()[name] = module
+    return module
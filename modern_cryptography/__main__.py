@@ -0,0 +1,6 @@
+import sys
+
+from modern_cryptography.cli import main
+
+
+sys.exit(main())
@@ -0,0 +1,52 @@
+import os
+
+from Crypto.Util.Padding import pad, unpad
+
+
+class CBCContext:
+    """
+    A cipher context holds a checked key for one of the pycryptodome block
+    ciphers, and an ECB cipher object built from it, which keeps the key
+    schedule.
+
+    CBC decryption of each block only depends on the ciphertext, so
+    messages of up to ecb_decrypt_limit bytes are decrypted with the ECB
+    object in one call and then XORed with the previous ciphertext blocks,
+    reusing the key schedule. Past that the XOR costs more than a key
+    schedule and a CBC cipher object is built instead. Encryption chains
+    each block into the next, which only runs in C in a CBC cipher object,
+    so one is built per message.
+
+    The contexts of 06_des_and_triple_des and 07_aes are cached per key, and
+    keep no state between calls, so they may be shared between threads.
+    """
+    ecb_decrypt_limit = 4096
+
+    def __init__(self, cipher_module, key: bytes) -> None:
+        self.cipher_module = cipher_module
+        self.block_size = cipher_module.block_size
+        self._key = bytes(key)
+        self._ecb = cipher_module.new(self._key, cipher_module.MODE_ECB)
+
+    def encrypt(self, data: bytes) -> bytes:
+        # Returns the IV followed by the ciphertext.
+        iv = os.urandom(self.block_size)
+        cipher = self.cipher_module.new(self._key,
+                                        self.cipher_module.MODE_CBC, iv)
+        return iv + cipher.encrypt(pad(data, self.block_size))
+
+    def decrypt(self, encrypted_data: bytes) -> bytes:
+        size = self.block_size
+        if len(encrypted_data) < 2 * size or len(encrypted_data) % size:
+            raise ValueError('Ciphertext has the wrong length.')
+        body = encrypted_data[size:]
+        if len(body) > self.ecb_decrypt_limit:
+            cipher = self.cipher_module.new(self._key,
+                                            self.cipher_module.MODE_CBC,
+                                            encrypted_data[:size])
+            return unpad(cipher.decrypt(body), size)
+        # Each block is the ECB decryption XOR the block before it, the IV
+        # for the first.
+        plain = int.from_bytes(self._ecb.decrypt(body), 'big') \
+            ^ int.from_bytes(encrypted_data[:-size], 'big')
+        return unpad(plain.to_bytes(len(body), 'big'), size)
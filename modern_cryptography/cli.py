@@ -0,0 +1,353 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import modern_cryptography
+
+
+"""
+Hash, HMAC, encrypt or decrypt every file under a directory:
+
+    python -m modern_cryptography hash DIRECTORY
+    python -m modern_cryptography hmac DIRECTORY --key-file KEY
+    python -m modern_cryptography encrypt DIRECTORY --key-file KEY -o OUT
+    python -m modern_cryptography decrypt OUT --key-file KEY -o DIRECTORY
+
+Files are read in chunks into one reused buffer and spread over a pool of
+worker processes. Encryption uses the framed AES-GCM stream format of
+07_aes.py and adds a .aes suffix, decryption removes it. Outputs are written
+to a temporary file and renamed once complete.
+
+Each file is written to the manifest, in batches, as a tab separated line of
+path, size and hex digest, the path and size of the file read. For hash and
+hmac the digest is of the file, for encrypt and decrypt it is the sha256 of
+the plaintext, so an encryption and its decryption list the same digest for
+each file. The manifests still differ, as decrypt reads f.aes where encrypt
+read f, and the encrypted file is larger.
+
+The size and mtime of every file processed are cached under
+modern_cryptography.CACHE_DIR, per command, directory, output and key.
+Files whose size and mtime have not changed since the last run are not read
+again.
+"""
+
+COMMANDS = ('hash', 'hmac', 'encrypt', 'decrypt')
+ENCRYPTED_SUFFIX = '.aes'
+
+
+class HashingReader:
+    # Hashes everything read from a file with readinto.
+    def __init__(self, file, hasher) -> None:
+        self.file = file
+        self.hasher = hasher
+
+    def readinto(self, buffer: bytearray | memoryview) -> int:
+        size = self.file.readinto(buffer)
+        self.hasher.update(memoryview(buffer)[:size])
+        return size
+
+
+class HashingWriter:
+    # Hashes everything written to a file.
+    def __init__(self, file, hasher) -> None:
+        self.file = file
+        self.hasher = hasher
+
+    def write(self, data: bytes | memoryview) -> int:
+        self.hasher.update(data)
+        return self.file.write(data)
+
+
+def read_chunks(path: str, chunk_size: int) -> Iterator[memoryview]:
+    # Each chunk is a view of the same buffer, valid until the next one.
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, 'rb') as file:
+        while size := file.readinto(buffer):
+            yield view[:size]
+
+
+def hash_file(path: str, chunk_size: int, manual: bool = False) -> str:
+    if manual:
+        return modern_cryptography.hash_functions.sha_256_file(path,
+                                                               chunk_size)
+    hasher = hashlib.sha256()
+    for chunk in read_chunks(path, chunk_size):
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def hmac_file(path: str, key: bytes, chunk_size: int) -> str:
+    context = modern_cryptography.message_authentification_codes \
+        .hmac_context(key)
+    return context.digest_chunks(read_chunks(path, chunk_size)).hex()
+
+
+def encrypt_file(path: str, out_path: str, key: bytes,
+                 chunk_size: int) -> str:
+    hasher = hashlib.sha256()
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    temporary = out_path + '.tmp'
+    try:
+        with open(path, 'rb') as source, open(temporary, 'wb') as sink:
+            modern_cryptography.aes.aes_encrypt_stream(
+                HashingReader(source, hasher), sink, key,
+                chunk_size=chunk_size)
+        os.replace(temporary, out_path)
+    finally:
+        # Only left behind if the output was not completed.
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return hasher.hexdigest()
+
+
+def decrypt_file(path: str, out_path: str, key: bytes) -> str:
+    hasher = hashlib.sha256()
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    temporary = out_path + '.tmp'
+    try:
+        with open(path, 'rb') as source, open(temporary, 'wb') as sink:
+            modern_cryptography.aes.aes_decrypt_stream(
+                source, HashingWriter(sink, hasher), key)
+        os.replace(temporary, out_path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return hasher.hexdigest()
+
+
+def process_file(task: tuple) -> tuple[str | None, str | None]:
+    """
+    Run one command on one file in a worker, returning the digest, or None
+    and the error if the file could not be processed.
+    """
+    command, path, out_path, key, chunk_size, manual = task
+    try:
+        if command == 'hash':
+            return hash_file(path, chunk_size, manual), None
+        if command == 'hmac':
+            return hmac_file(path, key, chunk_size), None
+        if command == 'encrypt':
+            return encrypt_file(path, out_path, key, chunk_size), None
+        return decrypt_file(path, out_path, key), None
+    except (OSError, ValueError) as error:
+        return None, f'{type(error).__name__}: {error}'
+
+
+def walk(root: str) -> Iterator[tuple[str, str, os.stat_result]]:
+    # Regular files under root in a stable order, as (relative path,
+    # path, stat), relative paths always use forward slashes.
+    for directory, directories, files in os.walk(root):
+        directories.sort()
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            if os.path.islink(path) or not os.path.isfile(path):
+                continue
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+            yield relative, path, os.stat(path)
+
+
+def output_path(command: str, relative: str, output: str | None) -> str | None:
+    if command == 'encrypt':
+        return os.path.join(output, relative + ENCRYPTED_SUFFIX)
+    if command == 'decrypt':
+        if relative.endswith(ENCRYPTED_SUFFIX):
+            relative = relative[:-len(ENCRYPTED_SUFFIX)]
+        return os.path.join(output, relative)
+    return None
+
+
+def cache_file(command: str, root: str, output: str | None,
+               key: bytes | None, manual: bool) -> str | None:
+    # One cache per command, directory, output and key, the key is hashed.
+    if modern_cryptography.CACHE_DIR is None:
+        return None
+    identity = json.dumps([command, os.path.abspath(root),
+                           output and os.path.abspath(output),
+                           key and hashlib.sha256(key).hexdigest(), manual])
+    name = hashlib.sha256(identity.encode()).hexdigest()[:32]
+    return os.path.join(modern_cryptography.CACHE_DIR, 'cli', name + '.json')
+
+
+def load_cache(path: str | None) -> dict[str, list]:
+    if path is None or not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_cache(path: str | None, cache: dict[str, list]) -> None:
+    if path is None:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(cache, file)
+    os.replace(temporary, path)
+
+
+def run(command: str, root: str, key: bytes | None = None,
+        output: str | None = None, manifest=None, workers: int | None = None,
+        chunk_size: int = 1 << 20, batch_size: int = 1000,
+        use_cache: bool = True, manual: bool = False) -> dict[str, int]:
+    """
+    Run command over every file under root, writing manifest lines to the
+    manifest file object. Returns counts of the files processed, skipped
+    as unchanged and failed, and the bytes read.
+    """
+    if command not in COMMANDS:
+        raise ValueError(f'Command must be one of {", ".join(COMMANDS)}.')
+    if command != 'hash' and key is None:
+        raise ValueError(f'{command} needs a key.')
+    if command in ('encrypt', 'decrypt') and output is None:
+        raise ValueError(f'{command} needs an output directory.')
+    if command in ('encrypt', 'decrypt') and len(key) not in (16, 24, 32):
+        raise ValueError('Key must be 16, 24, or 32 bytes long.')
+    workers = workers or os.cpu_count() or 1
+    # Encrypted outputs written into root would be picked up again.
+    skip = os.path.abspath(output) + os.sep if output else None
+
+    cache_path = cache_file(command, root, output, key, manual) \
+        if use_cache else None
+    cache = load_cache(cache_path)
+    # Only files seen in this run are kept, unless it stops early.
+    seen = {}
+    counts = {'files': 0, 'processed': 0, 'skipped': 0, 'errors': 0,
+              'bytes': 0}
+    batch = []
+
+    def write_batch() -> None:
+        if manifest is not None:
+            manifest.writelines(batch)
+            manifest.flush()
+        batch.clear()
+
+    def finish(relative: str, stat: os.stat_result, digest: str | None,
+               error: str | None) -> None:
+        counts['files'] += 1
+        if digest is None:
+            counts['errors'] += 1
+            print(f'{relative}: {error}', file=sys.stderr)
+            cache.pop(relative, None)
+            return
+        seen[relative] = [stat.st_size, stat.st_mtime_ns, digest]
+        batch.append(f'{relative}\t{stat.st_size}\t{digest}\n')
+        if len(batch) >= batch_size:
+            write_batch()
+
+    def tasks() -> Iterator[tuple[str, os.stat_result, tuple, bool]]:
+        # Yield a task to run, or the cached result of an unchanged file.
+        for relative, path, stat in walk(root):
+            if skip and os.path.abspath(path).startswith(skip):
+                continue
+            out_path = output_path(command, relative, output)
+            entry = cache.get(relative)
+            if entry and entry[:2] == [stat.st_size, stat.st_mtime_ns] \
+                    and (out_path is None or os.path.exists(out_path)):
+                counts['skipped'] += 1
+                yield relative, stat, (entry[2], None), True
+                continue
+            counts['processed'] += 1
+            counts['bytes'] += stat.st_size
+            yield relative, stat, (command, path, out_path, key, chunk_size,
+                                   manual), False
+
+    try:
+        if workers == 1:
+            for relative, stat, task, cached in tasks():
+                finish(relative, stat,
+                       *(task if cached else process_file(task)))
+            cache = {}
+            return counts
+
+        # Results are written in walk order, with at most a few tasks per
+        # worker in flight, so memory stays flat on large trees.
+        pending: deque[tuple[str, os.stat_result, Future | tuple]] = deque()
+
+        def ready() -> bool:
+            result = pending[0][2]
+            return not isinstance(result, Future) or result.done()
+
+        with ProcessPoolExecutor(workers) as executor:
+            for relative, stat, task, cached in tasks():
+                pending.append((relative, stat, task if cached
+                                else executor.submit(process_file, task)))
+                while pending and (len(pending) > 4 * workers or ready()):
+                    relative, stat, result = pending.popleft()
+                    if isinstance(result, Future):
+                        result = result.result()
+                    finish(relative, stat, *result)
+            while pending:
+                relative, stat, result = pending.popleft()
+                if isinstance(result, Future):
+                    result = result.result()
+                finish(relative, stat, *result)
+        cache = {}
+        return counts
+    finally:
+        write_batch()
+        save_cache(cache_path, {**cache, **seen})
+
+
+def read_key(args: argparse.Namespace) -> bytes | None:
+    # A key file holds the raw key, or the key in hex.
+    if args.key is not None:
+        return bytes.fromhex(args.key)
+    if args.key_file is None:
+        return None
+    with open(args.key_file, 'rb') as file:
+        data = file.read()
+    try:
+        return bytes.fromhex(data.decode())
+    except ValueError:
+        return data
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m modern_cryptography',
+        description='Hash, HMAC, encrypt or decrypt directory trees.')
+    parser.add_argument('command', choices=COMMANDS)
+    parser.add_argument('directory')
+    parser.add_argument('-o', '--output',
+                        help='output directory for encrypt and decrypt')
+    parser.add_argument('--key', help='key in hex')
+    parser.add_argument('--key-file', help='file holding the key')
+    parser.add_argument('--manifest', default='-',
+                        help='manifest file, - for stdout')
+    parser.add_argument('--workers', type=int,
+                        help='worker processes, one per CPU by default')
+    parser.add_argument('--chunk-size', type=int, default=1 << 20)
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='manifest lines written at a time')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='process every file, ignoring size and mtime')
+    parser.add_argument('--manual', action='store_true',
+                        help='hash with the manual sha_256 implementation')
+    args = parser.parse_args(argv)
+
+    try:
+        key = read_key(args)
+        if args.manifest == '-':
+            manifest = sys.stdout
+        else:
+            manifest = open(args.manifest, 'w')
+        try:
+            counts = run(args.command, args.directory, key, args.output,
+                         manifest, args.workers, args.chunk_size,
+                         args.batch_size, not args.no_cache, args.manual)
+        finally:
+            if manifest is not sys.stdout:
+                manifest.close()
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+
+    print(f"{counts['files']} files, {counts['processed']} processed, "
+          f"{counts['skipped']} unchanged, {counts['errors']} errors, "
+          f"{counts['bytes'] / 1e6:.1f} MB read", file=sys.stderr)
+    return 1 if counts['errors'] else 0
@@ -0,0 +1,105 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from modern_cryptography import CACHE_DIR, ROOT
+
+
+"""
+Generating a 2048 bit key takes hundreds of milliseconds, so the example keys
+of 02_digital_signatures and 08_rsa_cipher are only generated on first use,
+not at import. When MODERN_CRYPTO_CACHE is set to a directory, each key is
+saved in CACHE_DIR unencrypted as PEM, readable by the owner only, and
+loaded from there by later processes. Unlike the other caches, private keys
+are not written to the default directory when it is unset.
+"""
+
+KEY_CACHE_DIR = CACHE_DIR if os.environ.get('MODERN_CRYPTO_CACHE') else None
+
+# Attributes of an example key, computed on first use by make_key_getattr.
+KEY_ATTRIBUTES = {
+    'private_key': lambda key: key,
+    'public_key': lambda key: key.public_key(),
+    'private_numbers': lambda key: key.private_numbers(),
+    'public_numbers': lambda key: key.private_numbers().public_numbers,
+    'p': lambda key: key.private_numbers().p,     # First prime
+    'q': lambda key: key.private_numbers().q,     # Second prime
+    'n': lambda key: key.private_numbers().public_numbers.n,  # p*q
+    'e': lambda key: key.private_numbers().public_numbers.e,
+    'd': lambda key: key.private_numbers().d,     # inv(e) mod n
+}
+
+
+def load_or_generate_key(name: str, key_size: int = 2048,
+                         cache_dir: str | None = KEY_CACHE_DIR
+                         ) -> rsa.RSAPrivateKey:
+    # Load name.pem from the cache directory, generating and saving it
+    # if it is missing.
+    path = os.path.join(cache_dir, f'{name}.pem') if cache_dir else None
+    if path and os.path.exists(path):
+        with open(path, 'rb') as file:
+            key = serialization.load_pem_private_key(file.read(), None)
+        if isinstance(key, rsa.RSAPrivateKey) and key.key_size == key_size:
+            return key
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+    if path:
+        os.makedirs(cache_dir, exist_ok=True)
+        pem = key.private_bytes(serialization.Encoding.PEM,
+                                serialization.PrivateFormat.PKCS8,
+                                serialization.NoEncryption())
+        # mkstemp creates the file with mode 0600, under a unique name.
+        descriptor, temporary = tempfile.mkstemp(dir=cache_dir,
+                                                 suffix='.tmp')
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(pem)
+        os.replace(temporary, path)
+    return key
+
+
+def make_key_getattr(namespace: dict, loader,
+                     names: dict[str, str] | None = None):
+    """
+    Return a module __getattr__ for the module whose globals are namespace.
+    names maps its attribute names to those of KEY_ATTRIBUTES, all of them
+    under their own names by default. An attribute is computed from the key
+    returned by loader the first time it is used, then stored in namespace.
+    """
+    names = names or {name: name for name in KEY_ATTRIBUTES}
+
+    def __getattr__(name: str):
+        if name not in names:
+            raise AttributeError(f'module {namespace["__name__"]!r} '
+                                 f'has no attribute {name!r}')
+        value = KEY_ATTRIBUTES[names[name]](loader())
+        namespace[name] = value
+        return value
+    return __getattr__
+
+
+def benchmark_import_time(path: str, target: float = 0.2,
+                          runs: int = 5) -> dict[str, float | bool]:
+    """
+    Import the file at path in runs fresh interpreters, returning the median
+    time in seconds and whether it stays under target seconds. Raises
+    CalledProcessError if the import fails.
+    """
+    code = ('import importlib.util, sys, time\n'
+            'start = time.perf_counter()\n'
+            'spec = importlib.util.spec_from_file_location("m", sys.argv[1])\n'
+            'spec.loader.exec_module(importlib.util.module_from_spec(spec))\n'
+            'print(time.perf_counter() - start)\n')
+    times = sorted(
+        float(subprocess.run([sys.executable, '-c', code, path],
+                             capture_output=True, text=True, cwd=ROOT,
+                             check=True).stdout)
+        for _ in range(runs))
+    median = times[runs // 2]
+    ok = median < target
+    print(f'cold import {median * 1e3:.1f} ms, '
+          f'target {target * 1e3:.0f} ms: {"ok" if ok else "over target"}')
+    return {'median': median, 'target': target, 'ok': ok}